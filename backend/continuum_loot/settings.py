@@ -32,6 +32,35 @@ DB_FILE = os.getenv('DB_FILE', BASE_DIR / 'contloot.sqlite3')
 
 LOG_DIR = Path(os.getenv('LOG_DIR', BASE_DIR / 'dev_logs/'))
 
+# Players are marked inactive when they haven't attended any of this many of the newest raid days
+INACTIVE_AFTER_RAID_DAYS = int(os.getenv('INACTIVE_AFTER_RAID_DAYS', 8))
+
+# PRAGMAs run on every new SQLite connection (see loot/db.py).  WAL lets reads carry on during upload writes,
+# and is safe with synchronous=NORMAL.  SQLITE_JOURNAL_MODE=DELETE and SQLITE_SYNCHRONOUS=FULL are SQLite's defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),  # Bytes
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -32 * 1024)),  # Negative means KiB
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),  # Milliseconds
+}
+
+# Per-request timing (loot/timing.py): a Server-Timing header and a log line for every request, logged as a
+# warning when it goes over any of these budgets
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', 'False') == 'True'
+REQUEST_TIMING_BUDGETS = {
+    'total_ms': float(os.getenv('TIMING_BUDGET_TOTAL_MS', 300)),
+    'sql_ms': float(os.getenv('TIMING_BUDGET_SQL_MS', 100)),
+    'queries': int(os.getenv('TIMING_BUDGET_QUERIES', 25)),
+    'bytes': int(os.getenv('TIMING_BUDGET_BYTES', 512 * 1024)),
+}
+
+# Prometheus metrics at /metrics (loot/metrics.py).  Workers add their samples to METRICS_FILE every
+# METRICS_FLUSH_SECONDS, so /metrics reports totals across all of them.
+METRICS = os.getenv('METRICS', 'False') == 'True'
+METRICS_FILE = os.getenv('METRICS_FILE', BASE_DIR / 'metrics.sqlite3')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+
 ALLOWED_HOSTS = ['localhost', 'continuum-loot.tfrom.me']
 
 LOGGING = {
@@ -74,7 +103,21 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 ]
 
+# The JSON renderer and parser use orjson when it is installed (loot/renderers.py, loot/parsers.py)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'loot.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'loot.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
 MIDDLEWARE = [
+    'loot.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -112,6 +155,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': DB_FILE,
+        # Seconds to keep a connection open between requests, instead of reopening the DB for each one
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
     }
 }
 
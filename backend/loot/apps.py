@@ -1,5 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class LootConfig(AppConfig):
     name = 'loot'
+
+    def ready(self):
+        from .db import tune_sqlite
+        from .models import (ClassPrio, IndividualPrio, RaidDay, refresh_prio_summary, remember_last_attended,
+                             restore_last_attended)
+        from .revisions import track_writes
+        connection_created.connect(tune_sqlite)
+        track_writes()
+        for model in (ClassPrio, IndividualPrio):
+            post_save.connect(refresh_prio_summary, sender=model, dispatch_uid=f'prio_summary_save_{model.__name__}')
+            post_delete.connect(refresh_prio_summary, sender=model,
+                                dispatch_uid=f'prio_summary_delete_{model.__name__}')
+        pre_delete.connect(remember_last_attended, sender=RaidDay, dispatch_uid='last_attended_pre_delete')
+        post_delete.connect(restore_last_attended, sender=RaidDay, dispatch_uid='last_attended_post_delete')
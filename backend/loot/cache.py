@@ -0,0 +1,198 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import metrics, renderers, revisions, timing
+
+try:
+    import brotli
+except ImportError:  # Optional, only gzip is offered without it
+    brotli = None
+
+# (view name, cache_query_params values) -> (revision, data, rendered JSON bytes, {encoding: compressed bytes})
+# Lives per process; the revision is read from the DB on every request so workers never serve stale data.
+# Least recently used first, and capped at MAX_CACHED_RESPONSES so cursors or filters can't grow it without bound.
+_responses = OrderedDict()
+_lock = threading.Lock()
+MAX_CACHED_RESPONSES = 100
+
+json_renderer = renderers.JSONRenderer()
+
+# Content-Encodings in order of preference.  Each is compressed at most once per cached revision, so the levels
+# are set for size rather than speed.
+COMPRESSORS = {'gzip': lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS = {'br': lambda content: brotli.compress(content, quality=9), **COMPRESSORS}
+# Smaller bodies aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+
+def clear():
+    with _lock:
+        _responses.clear()
+
+
+def negotiate_encoding(request):
+    # The first of COMPRESSORS that Accept-Encoding allows, or None for identity
+    accepted = {}
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.partition(';')
+        try:
+            quality = float(params.strip()[2:]) if params.strip().startswith('q=') else 1.0
+        except ValueError:
+            quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in COMPRESSORS:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+class CachedResponse(Response):
+    # Keeps .data around for the browsable API and tests, but skips rendering when JSON was asked for,
+    # and sends a compressed copy when Accept-Encoding allows it.  compressed is shared with the cache entry,
+    # so each encoding is compressed once per revision rather than once per request.
+
+    def __init__(self, data, content, compressed=None, **kwargs):
+        super().__init__(data, **kwargs)
+        self.cached_content = content
+        self.compressed = compressed if compressed is not None else {}
+
+    @property
+    def rendered_content(self):
+        if not (isinstance(self.accepted_renderer, JSONRenderer)
+                and self.accepted_media_type == json_renderer.media_type):
+            return super().rendered_content
+
+        self['Content-Type'] = json_renderer.media_type
+        encoding = negotiate_encoding(self.renderer_context['request'])
+        if encoding is None or len(self.cached_content) < MIN_COMPRESS_SIZE:
+            return self.cached_content
+        # Runs inside response.render, so the timing middleware already counts this as render time
+        if encoding not in self.compressed:
+            self.compressed[encoding] = COMPRESSORS[encoding](self.cached_content)
+        self['Content-Encoding'] = encoding
+        return self.compressed[encoding]
+
+
+class CachedViewSetMixin:
+    # Models whose changes show up in this view's responses
+    revision_models = []
+    # Whether ?since=<revision> is supported, which needs a revision field on the model
+    delta_sync = False
+    # Query parameters the response depends on.  Cached responses are keyed on these alone, so anything else in
+    # the query string shares their entry.
+    cache_query_params = []
+
+    def get_representation(self, request):
+        # JSON vs the browsable API, and the Content-Encoding a cached body would be sent with
+        encoding = negotiate_encoding(request)
+        return f"{request.accepted_renderer.format}-{encoding}" if encoding else request.accepted_renderer.format
+
+    def get_etag(self, request, revision):
+        # The revision covers the data, the representation covers how it is sent
+        return quote_etag(f"{revision}-{self.get_representation(request)}")
+
+    def is_not_modified(self, request, etag):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        return etag in etags or '*' in etags
+
+    def conditional_response(self, request, build_response):
+        # Answers If-None-Match from the revision alone, before any queryset or serializer runs
+        revision = revisions.current(*self.revision_models)
+        etag = self.get_etag(request, revision)
+
+        if self.is_not_modified(request, etag):
+            metrics.inc('loot_response_cache_total', view=request.resolver_match.view_name, result='not_modified')
+            response = Response(status=304)
+        else:
+            response = build_response(revision)
+
+        response['ETag'] = etag
+        # Let browsers keep the body but always come back to check the ETag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def cached_render(self, request, revision, build_data):
+        # (data, rendered JSON, compressed copies) for this view and query string at revision, from the cache
+        # or from build_data()
+        view_name = type(self).__name__
+        key = (view_name, tuple((param, tuple(request.query_params.getlist(param)))
+                                for param in self.cache_query_params if param in request.query_params))
+        with _lock:
+            cached = _responses.get(key)
+            hit = cached is not None and cached[0] == revision
+            if hit:
+                _responses.move_to_end(key)
+        if hit:
+            metrics.inc('loot_response_cache_total', view=request.resolver_match.view_name, result='hit')
+            return cached[1:]
+        metrics.inc('loot_response_cache_total', view=request.resolver_match.view_name, result='miss')
+
+        with timing.measure('serialize'):
+            data = build_data()
+        with timing.measure('render'):
+            content = json_renderer.render(data)
+        entry = (revision, data, content, {})
+        with _lock:
+            # Revisions only go up, so this view's entries from older revisions can never be hit again
+            for stale_key in [k for k, v in _responses.items() if k[0] == view_name and v[0] < revision]:
+                del _responses[stale_key]
+            # A request that read an older snapshot mustn't replace a newer entry
+            if key not in _responses:
+                _responses[key] = entry
+            while len(_responses) > MAX_CACHED_RESPONSES:
+                _responses.popitem(last=False)
+        return entry[1:]
+
+    def delta_response(self, request, since, revision):
+        # Only the rows stamped after since, plus the ids of rows that were deleted or filtered out since
+        model = self.get_queryset().model
+        if since < revisions.resync_revision():
+            # Every row, unpaginated, so the reset has the same shape as a delta even with ?page_size
+            rows = timing.serialize(self.get_serializer(self.filter_queryset(self.get_queryset()), many=True))
+            return Response({'revision': revision, 'reset': True, 'rows': rows, 'deleted': []})
+
+        # Going through an id subquery lets SQLite seek on the revision index and sort only the changed rows,
+        # instead of walking the list's ordering index and checking every row's revision
+        changed = model.objects.filter(revision__gt=since)
+        queryset = self.filter_queryset(self.get_queryset()).filter(id__in=changed.values('id'))
+        rows = timing.serialize(self.get_serializer(queryset, many=True))
+
+        visible_ids = {row['id'] for row in rows}
+        deleted_ids = set(revisions.buried_since(model, since))
+        deleted_ids.update(row_id for row_id in changed.values_list('id', flat=True) if row_id not in visible_ids)
+
+        return Response({'revision': revision, 'reset': False, 'rows': rows, 'deleted': sorted(deleted_ids)})
+
+    def list(self, request, *args, **kwargs):
+        def build_response(revision):
+            if self.delta_sync and 'since' in request.query_params:
+                try:
+                    since = int(request.query_params['since'])
+                except ValueError:
+                    raise ValidationError({'since': 'Must be a revision number'})
+                return self.delta_response(request, since, revision)
+
+            data, content, compressed = self.cached_render(
+                request, revision, lambda: super(CachedViewSetMixin, self).list(request, *args, **kwargs).data)
+            return CachedResponse(data, content, compressed)
+
+        return self.conditional_response(request, build_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        def build_response(revision):
+            with timing.measure('serialize'):
+                return super(CachedViewSetMixin, self).retrieve(request, *args, **kwargs)
+
+        return self.conditional_response(request, build_response)
@@ -0,0 +1,10 @@
+from django.conf import settings
+
+
+def tune_sqlite(sender, connection, **kwargs):
+    # connection_created receiver that applies settings.SQLITE_PRAGMAS
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,71 @@
+import time
+
+from django.db import transaction
+
+from . import revisions
+from .models import ClassPrio, IndividualPrio, update_prio_summaries
+
+
+class Importer:
+    # Bulk loads rows for the seed and tier scripts, all in one transaction:
+    #
+    #     with Importer() as importer:
+    #         importer.create(Boss, bosses)
+    #         boss_ids = importer.ids(Boss, 'name', 'raid_id')
+    #
+    # Rows that are already there (same primary key or unique fields) are skipped, so an import that failed part
+    # way can just be run again.  Clients resync afterwards, since the import doesn't stamp revisions row by row.
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        # (model, fields) -> {value(s): id}
+        self._ids = {}
+        # model name -> [rows, new rows, seconds]
+        self.stats = {}
+        self._atomic = transaction.atomic()
+
+    def __enter__(self):
+        self._atomic.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and any(new for _, new, _ in self.stats.values()):
+            revisions.force_resync()
+        self.seconds = time.perf_counter() - self.start
+        return self._atomic.__exit__(exc_type, exc_value, traceback)
+
+    def ids(self, model, *fields):
+        # {value: id}, or {(value, ...): id} for several fields.  Loaded once, and again after model's next create.
+        key = (model, fields)
+        if key not in self._ids:
+            rows = model.objects.values_list(*fields, 'id')
+            self._ids[key] = {row[0] if len(fields) == 1 else row[:-1]: row[-1] for row in rows}
+        return self._ids[key]
+
+    def create(self, model, objs):
+        # Returns how many rows were new
+        start = time.perf_counter()
+        objs = list(objs)
+        before = model.objects.count()
+        model.objects.bulk_create(objs, batch_size=self.batch_size, ignore_conflicts=True)
+        new = model.objects.count() - before
+        self._ids = {key: ids for key, ids in self._ids.items() if key[0] is not model}
+        if model in (ClassPrio, IndividualPrio):
+            # bulk_create skips save(), so Item's prio summaries are refreshed here
+            update_prio_summaries({obj.item_id for obj in objs})
+
+        stats = self.stats.setdefault(model.__name__, [0, 0, 0.0])
+        stats[0] += len(objs)
+        stats[1] += new
+        stats[2] += time.perf_counter() - start
+        return new
+
+    def report(self):
+        lines = [f"{'model':<20} {'rows':>7} {'new':>7} {'seconds':>8} {'rows/s':>9}"]
+        for name, (rows, new, seconds) in self.stats.items():
+            lines.append(f'{name:<20} {rows:>7} {new:>7} {seconds:>8.2f} {rows / max(seconds, 1e-6):>9.0f}')
+        rows = sum(rows for rows, _, _ in self.stats.values())
+        lines.append(f"{'total':<20} {rows:>7} {sum(new for _, new, _ in self.stats.values()):>7} "
+                     f'{self.seconds:>8.2f} {rows / max(self.seconds, 1e-6):>9.0f}')
+        return '\n'.join(lines)
@@ -0,0 +1,134 @@
+import atexit
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from django.conf import settings
+
+# Prometheus metrics shared by every worker process.  Each process adds up its samples in memory and folds them
+# into a small SQLite file (METRICS_FILE) at most every METRICS_FLUSH_SECONDS, so requests never wait on it and
+# the app database never sees the writes.  /metrics flushes its own worker and reads the totals back.
+
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+QUERY_BUCKETS = [1, 2, 5, 10, 25, 50, 100]
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'loot_requests_total': ('counter', 'Requests served, by view, method and status', None),
+    'loot_request_duration_seconds': ('histogram', 'Time spent handling a request, by view', DURATION_BUCKETS),
+    'loot_request_queries': ('histogram', 'Database queries run for a request, by view', QUERY_BUCKETS),
+    'loot_response_cache_total': ('counter', 'Cached list responses by view: hit, miss or not_modified', None),
+    'loot_upload_rows_total': ('counter', 'Players and loot rows recorded by the upload endpoints', None),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# (sample name, label string) -> value not yet written to METRICS_FILE
+_pending = {}
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def format_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped))
+
+
+def _add(samples):
+    with _lock:
+        for key, value in samples:
+            _pending[key] = _pending.get(key, 0) + value
+
+
+def inc(name, value=1, **labels):
+    if settings.METRICS:
+        _add([((name, format_labels(labels)), value)])
+
+
+def observe(name, value, **labels):
+    # Buckets are stored cumulatively, the way Prometheus exposes them.  The ones below value still get a 0 so
+    # every series has all of its buckets from the first scrape.
+    if not settings.METRICS:
+        return
+    buckets = METRICS[name][2]
+    label_string = format_labels(labels)
+    prefix = label_string + ',' if label_string else ''
+    samples = [((f'{name}_bucket', f'{prefix}le="{le}"'), int(value <= le)) for le in buckets]
+    samples += [
+        ((f'{name}_bucket', f'{prefix}le="+Inf"'), 1),
+        ((f'{name}_sum', label_string), value),
+        ((f'{name}_count', label_string), 1),
+    ]
+    _add(samples)
+
+
+def _connect():
+    db = sqlite3.connect(settings.METRICS_FILE, timeout=5)
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('CREATE TABLE IF NOT EXISTS metric (name TEXT, labels TEXT, value REAL, PRIMARY KEY (name, labels))'
+               ' WITHOUT ROWID')
+    return db
+
+
+def flush(force=False):
+    global _last_flush
+    with _lock:
+        if not _pending or (not force and time.monotonic() - _last_flush < settings.METRICS_FLUSH_SECONDS):
+            return
+        samples = list(_pending.items())
+        _pending.clear()
+        _last_flush = time.monotonic()
+
+    try:
+        with closing(_connect()) as db, db:
+            db.executemany('INSERT INTO metric VALUES (?, ?, ?) '
+                           'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                           [(name, labels, value) for (name, labels), value in samples])
+    except sqlite3.Error:
+        # Another worker held the file for longer than the timeout; keep the samples for the next flush
+        _add(samples)
+
+
+def reset():
+    with _lock:
+        _pending.clear()
+    with closing(_connect()) as db, db:
+        db.execute('DELETE FROM metric')
+
+
+def _sort_key(row):
+    # Histogram buckets in increasing le order, everything else by its labels
+    name, labels, _ = row
+    series, _, le = labels.rpartition('le="')
+    if name.endswith('_bucket') and le:
+        return name, series, float(le.rstrip('"'))
+    return name, labels, 0
+
+
+def _format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def render():
+    # Totals from every worker in the Prometheus text format
+    flush(force=True)
+    with closing(_connect()) as db:
+        rows = sorted(db.execute('SELECT name, labels, value FROM metric'), key=_sort_key)
+
+    lines = []
+    for metric, (kind, help_text, _) in METRICS.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        names = {metric} if kind == 'counter' else {f'{metric}_bucket', f'{metric}_sum', f'{metric}_count'}
+        for name, labels, value in rows:
+            if name in names:
+                lines.append(f'{name}{{{labels}}} {_format_value(value)}' if labels else
+                             f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Whatever a worker hasn't flushed yet when it shuts down
+atexit.register(flush, force=True)
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.5 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+def create_revisions(apps, schema_editor):
+    Revision = apps.get_model('loot', 'Revision')
+    db_alias = schema_editor.connection.alias
+    names = ['player', 'wishlist', 'item', 'classprio', 'individualprio', 'raid', 'boss', 'raidday', 'loothistory']
+    Revision.objects.using(db_alias).bulk_create([Revision(name=name) for name in names])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0015_auto_20210712_1702'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_revisions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.5 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+def create_resync_revision(apps, schema_editor):
+    Revision = apps.get_model('loot', 'Revision')
+    db_alias = schema_editor.connection.alias
+    # Rows that already exist are stamped 0, so any cursor from before now has to do a full sync
+    value = max(Revision.objects.using(db_alias).values_list('value', flat=True), default=0) + 1
+    Revision.objects.using(db_alias).update(value=value)
+    Revision.objects.using(db_alias).create(name='resync', value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0016_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=30)),
+                ('row_id', models.IntegerField()),
+                ('revision', models.PositiveIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='loothistory',
+            name='revision',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='player',
+            name='revision',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(create_resync_revision, migrations.RunPython.noop),
+    ]
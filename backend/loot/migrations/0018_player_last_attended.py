@@ -0,0 +1,29 @@
+# Generated by Django 3.2.5 on 2026-10-18 13:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def set_last_attended(apps, schema_editor):
+    Player = apps.get_model('loot', 'Player')
+    RaidDay = apps.get_model('loot', 'RaidDay')
+    db_alias = schema_editor.connection.alias
+    newest = RaidDay.objects.using(db_alias).filter(player=OuterRef('pk')).order_by('-date', '-id').values('id')[:1]
+    Player.objects.using(db_alias).update(last_attended=Subquery(newest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0017_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='last_attended',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='loot.raidday'),
+        ),
+        migrations.RunPython(set_last_attended, migrations.RunPython.noop),
+    ]
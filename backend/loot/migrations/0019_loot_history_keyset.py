@@ -0,0 +1,41 @@
+# Generated by Django 3.2.5 on 2026-10-18 13:25
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_raid_day_date(apps, schema_editor):
+    LootHistory = apps.get_model('loot', 'LootHistory')
+    RaidDay = apps.get_model('loot', 'RaidDay')
+    db_alias = schema_editor.connection.alias
+    raid_day_date = RaidDay.objects.using(db_alias).filter(id=OuterRef('raid_day_id')).values('date')[:1]
+    LootHistory.objects.using(db_alias).update(raid_day_date=Subquery(raid_day_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0018_player_last_attended'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loothistory',
+            name='raid_day_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_raid_day_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='loothistory',
+            name='raid_day_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='loothistory',
+            index=models.Index(fields=['raid_day_date', 'id'], name='loothistory_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='raidday',
+            index=models.Index(fields=['date', 'id'], name='raidday_date_id_idx'),
+        ),
+    ]
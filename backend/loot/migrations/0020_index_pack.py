@@ -0,0 +1,70 @@
+# Generated by Django 3.2.5 on 2026-10-18 13:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_slots(apps, schema_editor):
+    # The new unique constraints need one row per slot.  Duplicates are real data (every duplicate wishlist row
+    # was shown), so they are listed for an admin to resolve rather than deleted here.
+    db_alias = schema_editor.connection.alias
+    duplicates = []
+    for model_name, fields in [('Wishlist', ['player', 'priority']),
+                               ('ClassPrio', ['item', 'prio']),
+                               ('IndividualPrio', ['item', 'prio'])]:
+        model = apps.get_model('loot', model_name)
+        slots = (model.objects.using(db_alias).values(*fields).annotate(rows=Count('id')).filter(rows__gt=1)
+                 .order_by(*fields))
+        duplicates += [f"{model_name} ({', '.join(f'{field} {slot[field]}' for field in fields)}): {slot['rows']} rows"
+                       for slot in slots]
+    if duplicates:
+        raise RuntimeError("These slots hold more than one row, keep one of each and migrate again: "
+                           + '; '.join(duplicates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0019_loot_history_keyset'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_slots, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='wishlist',
+            options={'ordering': ['player_id', 'priority']},
+        ),
+        migrations.AlterField(
+            model_name='tombstone',
+            name='revision',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['last_attended'], name='player_active_attended_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='individualprio',
+            index=models.Index(fields=['player', 'item'], name='individualprio_player_item_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model_name', 'revision'], name='tombstone_model_revision_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wishlist',
+            index=models.Index(fields=['player', 'item'], name='wishlist_player_item_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='classprio',
+            constraint=models.UniqueConstraint(fields=('item', 'prio'), name='classprio_item_prio_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='individualprio',
+            constraint=models.UniqueConstraint(fields=('item', 'prio'), name='individualprio_item_prio_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('player', 'priority'), name='wishlist_player_priority_uniq'),
+        ),
+    ]
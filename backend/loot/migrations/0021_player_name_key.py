@@ -0,0 +1,44 @@
+# Generated by Django 3.2.5 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def set_name_key(apps, schema_editor):
+    Player = apps.get_model('loot', 'Player')
+    db_alias = schema_editor.connection.alias
+    players = list(Player.objects.using(db_alias).only('name'))
+    by_key = {}
+    for player in players:
+        # Same as loot.models.normalize_name
+        player.name_key = player.name.split('-', 1)[0].strip().lower()
+        by_key.setdefault(player.name_key, []).append(player)
+
+    # name_key is unique, so players that only differ by case or realm have to be renamed or merged first
+    collisions = {key: group for key, group in by_key.items() if len(group) > 1}
+    if collisions:
+        listed = '; '.join(', '.join(f'{player.name} (id {player.id})' for player in group)
+                           for group in collisions.values())
+        raise RuntimeError(f"These players have the same name once case and realm are ignored, rename or merge "
+                           f"them and migrate again: {listed}")
+    Player.objects.using(db_alias).bulk_update(players, ['name_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0020_index_pack'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=20, null=True),
+        ),
+        migrations.RunPython(set_name_key, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='player',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+    ]
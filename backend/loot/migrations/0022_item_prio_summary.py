@@ -0,0 +1,54 @@
+# Generated by Django 3.2.5 on 2026-10-18 13:59
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def set_prio_summaries(apps, schema_editor):
+    # Same as loot.models.update_prio_summaries
+    Item = apps.get_model('loot', 'Item')
+    ClassPrio = apps.get_model('loot', 'ClassPrio')
+    IndividualPrio = apps.get_model('loot', 'IndividualPrio')
+    db_alias = schema_editor.connection.alias
+
+    def holder(model, field, prio):
+        return Subquery(model.objects.using(db_alias).filter(item=OuterRef('pk'), prio=prio).values(field)[:1])
+
+    Item.objects.using(db_alias).update(
+        iprio_1=holder(IndividualPrio, 'player_id', 1),
+        iprio_2=holder(IndividualPrio, 'player_id', 2),
+        cprio_1=holder(ClassPrio, 'class_name', 1),
+        cprio_2=holder(ClassPrio, 'class_name', 2),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loot', '0021_player_name_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='cprio_1',
+            field=models.CharField(blank=True, editable=False, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='cprio_2',
+            field=models.CharField(blank=True, editable=False, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='iprio_1',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='loot.player'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='iprio_2',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='loot.player'),
+        ),
+        migrations.RunPython(set_prio_summaries, migrations.RunPython.noop),
+    ]
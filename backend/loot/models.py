@@ -1,9 +1,20 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.contrib.auth.models import User
 
 
+def normalize_name(name):
+    # How a player name is matched: case-insensitive, and without the realm the addon appends ("Name-Realm")
+    return name.split('-', 1)[0].strip().lower()
+
+
 class Player(models.Model):
 
+    class Meta:
+        # The inactivity sweep only has to look at players who are still active
+        indexes = [models.Index(fields=['last_attended'], condition=models.Q(is_active=True),
+                                name='player_active_attended_idx')]
+
     class Classes(models.TextChoices):
         DRUID = 'DR'
         HUNTER = 'HN'
@@ -34,21 +45,38 @@ class Player(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, blank=True)
     name = models.CharField(max_length=20, unique=True)
+    # normalize_name(name), set on save; bulk writes have to fill it in themselves.  Look players up by this.
+    name_key = models.CharField(max_length=20, unique=True, editable=False)
     notes = models.TextField(blank=True)
     player_class = models.CharField(max_length=2, choices=Classes.choices, default=Classes.WARRIOR)
     role = models.CharField(max_length=1, choices=Roles.choices, default=Roles.DPS)
     rank = models.IntegerField(choices=Ranks.choices, default=Ranks.TRIAL)
     alts = models.ManyToManyField('self', blank=True)
     attendance = models.ManyToManyField('RaidDay', blank=True)
+    # Newest RaidDay in attendance, kept up to date on write so is_active doesn't need an attendance scan.
+    # Moving or deleting a raid day recomputes it for the players involved, see update_last_attended.
+    last_attended = models.ForeignKey('RaidDay', related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Revision of the last write to this player, its attendance or its wishlist
+    revision = models.PositiveIntegerField(default=0, db_index=True)
     # wishlist
 
+    def save(self, *args, **kwargs):
+        self.name_key = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
 
 class Wishlist(models.Model):
 
+    class Meta:
+        # priority is the wishlist slot; the same item may fill more than one
+        ordering = ['player_id', 'priority']
+        constraints = [models.UniqueConstraint(fields=['player', 'priority'], name='wishlist_player_priority_uniq')]
+        indexes = [models.Index(fields=['player', 'item'], name='wishlist_player_item_idx')]
+
     player = models.ForeignKey(Player, related_name='wishlist', on_delete=models.CASCADE)
     item = models.ForeignKey('Item', on_delete=models.CASCADE)
     priority = models.PositiveSmallIntegerField()
@@ -72,6 +100,16 @@ class Item(models.Model):
     notes = models.TextField(blank=True)
     raid = models.ForeignKey('Raid', on_delete=models.CASCADE)
     bosses = models.ManyToManyField('Boss')
+    # Who holds prio 1 and 2 in individual_prios and class_prios, kept up to date on write so the item list can
+    # be read, sorted and filtered without the prio tables.  refresh_prio_summary refreshes them whenever a prio
+    # row is saved or deleted, cascades included; bulk_create sends no signals, so bulk inserts have to call
+    # update_prio_summaries() themselves.
+    iprio_1 = models.ForeignKey(Player, related_name='+', on_delete=models.SET_NULL, null=True, blank=True,
+                                editable=False)
+    iprio_2 = models.ForeignKey(Player, related_name='+', on_delete=models.SET_NULL, null=True, blank=True,
+                                editable=False)
+    cprio_1 = models.CharField(max_length=50, null=True, blank=True, editable=False)
+    cprio_2 = models.CharField(max_length=50, null=True, blank=True, editable=False)
     # individual_prios
     # class_prios
 
@@ -88,6 +126,7 @@ class ClassPrio(models.Model):
     class Meta:
         verbose_name = 'Class Prio'
         verbose_name_plural = 'Class Prios'
+        constraints = [models.UniqueConstraint(fields=['item', 'prio'], name='classprio_item_prio_uniq')]
 
     item = models.ForeignKey(Item, related_name='class_prios', on_delete=models.CASCADE)
     class_name = models.CharField(max_length=50)
@@ -103,6 +142,8 @@ class IndividualPrio(models.Model):
     class Meta:
         verbose_name = 'Individual Prio'
         verbose_name_plural = 'Individual Prios'
+        constraints = [models.UniqueConstraint(fields=['item', 'prio'], name='individualprio_item_prio_uniq')]
+        indexes = [models.Index(fields=['player', 'item'], name='individualprio_player_item_idx')]
 
     item = models.ForeignKey(Item, related_name='individual_prios', on_delete=models.CASCADE)
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
@@ -113,6 +154,42 @@ class IndividualPrio(models.Model):
         return f"{self.player.name} has prio {self.prio} on {self.item.name}"
 
 
+def update_last_attended(players):
+    # Recomputes last_attended for a Player queryset in one UPDATE, like migration 0018
+    newest = RaidDay.objects.filter(player=OuterRef('pk')).order_by('-date', '-id').values('id')[:1]
+    players.update(last_attended=Subquery(newest))
+
+
+def remember_last_attended(sender, instance, **kwargs):
+    # pre_delete receiver for RaidDay, connected in LootConfig.ready.  The delete sets these players'
+    # last_attended to NULL, even when they attended other raid days.
+    instance.last_attended_player_ids = list(Player.objects.filter(last_attended=instance).values_list('id', flat=True))
+
+
+def restore_last_attended(sender, instance, **kwargs):
+    # post_delete receiver for RaidDay, once the raid day and its attendance rows are gone
+    update_last_attended(Player.objects.filter(id__in=instance.last_attended_player_ids))
+
+
+def refresh_prio_summary(sender, instance, **kwargs):
+    # post_save and post_delete receiver for ClassPrio and IndividualPrio, connected in LootConfig.ready
+    update_prio_summaries([instance.item_id])
+
+
+def update_prio_summaries(item_ids=None):
+    # Recomputes Item.iprio_1 ... cprio_2 from the prio tables for item_ids (all items if None), in one UPDATE
+    def holder(model, field, prio):
+        return Subquery(model.objects.filter(item=OuterRef('pk'), prio=prio).values(field)[:1])
+
+    items = Item.objects.all() if item_ids is None else Item.objects.filter(id__in=item_ids)
+    items.update(
+        iprio_1=holder(IndividualPrio, 'player_id', 1),
+        iprio_2=holder(IndividualPrio, 'player_id', 2),
+        cprio_1=holder(ClassPrio, 'class_name', 1),
+        cprio_2=holder(ClassPrio, 'class_name', 2),
+    )
+
+
 class Raid(models.Model):
     name = models.CharField(max_length=30)
     short_name = models.CharField(max_length=10)
@@ -142,11 +219,20 @@ class RaidDay(models.Model):
         verbose_name = 'Raid Day'
         verbose_name_plural = 'Raid Days'
         ordering = ['-date', '-id']
+        indexes = [models.Index(fields=['date', 'id'], name='raidday_date_id_idx')]
 
     name = models.CharField(max_length=30)
     date = models.DateField()
     raid = models.ForeignKey(Raid, on_delete=models.CASCADE)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        LootHistory.objects.filter(raid_day=self).exclude(raid_day_date=self.date).update(raid_day_date=self.date)
+        if not adding:
+            # A new date can change which raid day is newest for the players who attended this one
+            update_last_attended(Player.objects.filter(attendance=self))
+
     def __str__(self):
         return self.name
 
@@ -156,10 +242,46 @@ class LootHistory(models.Model):
     class Meta:
         verbose_name = 'Loot History'
         verbose_name_plural = 'Loot History'
+        indexes = [models.Index(fields=['raid_day_date', 'id'], name='loothistory_date_id_idx')]
 
     raid_day = models.ForeignKey(RaidDay, on_delete=models.CASCADE)
+    # Copy of raid_day.date so history can be ordered and paged on an index without joining RaidDay.
+    # Set on save, bulk writes have to fill it in themselves.
+    raid_day_date = models.DateField(editable=False)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    revision = models.PositiveIntegerField(default=0, db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.raid_day_date = self.raid_day.date
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.item} to {self.player}"
+
+
+class Revision(models.Model):
+    # One row per tracked model, set to a new global high-water mark whenever that table changes.
+    # Used to version cached API responses and as the cursor for ?since= delta syncs.
+    # The 'resync' row marks the oldest cursor a delta sync can still be built from.
+
+    name = models.CharField(max_length=30, unique=True)
+    value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} at revision {self.value}"
+
+
+class Tombstone(models.Model):
+    # Left behind when the API deletes a LootHistory row so delta syncs can report it.  Other deletes force a
+    # resync instead, which also prunes the tombstones no cursor can reach any more.
+
+    class Meta:
+        indexes = [models.Index(fields=['model_name', 'revision'], name='tombstone_model_revision_idx')]
+
+    model_name = models.CharField(max_length=30)
+    row_id = models.IntegerField()
+    revision = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.model_name} {self.row_id} deleted at revision {self.revision}"
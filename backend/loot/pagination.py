@@ -0,0 +1,61 @@
+from datetime import date
+from urllib.parse import urlencode
+
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    # Opt in with ?page_size=N.  Rather than an OFFSET, each page seeks past the last row of the previous one
+    # (?cursor=<date>.<id>) on the (date, id) index, so a page costs the same no matter how deep it is.
+    # Expects the queryset to be ordered by -date_field, -id.
+    date_field = 'raid_day_date'
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_size_query_param not in request.query_params:
+            return None
+
+        try:
+            page_size = min(int(request.query_params[self.page_size_query_param]), self.max_page_size)
+            if page_size < 1:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be a positive number'})
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                cursor_date, cursor_id = cursor.split('.')
+                cursor_date, cursor_id = date.fromisoformat(cursor_date), int(cursor_id)
+            except ValueError:
+                raise ValidationError({self.cursor_query_param: 'Must be <date>.<id>'})
+            # Spelled as a range plus an exclude rather than (date < d OR (date = d AND id < i)):
+            # SQLite only seeks the index on the former, and walks it from the top on the latter.
+            queryset = (queryset.filter(**{f'{self.date_field}__lte': cursor_date})
+                                .exclude(**{self.date_field: cursor_date, 'id__gte': cursor_id}))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset.annotate(cursor_date=F(self.date_field))[:page_size + 1])
+        self.request = request
+        self.page_size = page_size
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = f"{rows[-1].cursor_date.isoformat()}.{rows[-1].id}"
+        return rows
+
+    def get_next_link(self):
+        # Relative, and built only from the pagination parameters, since the page is cached for every client
+        # that asks for the same page_size and cursor
+        if self.next_cursor is None:
+            return None
+        query = urlencode({self.page_size_query_param: self.page_size, self.cursor_query_param: self.next_cursor})
+        return f'{self.request.path}?{query}'
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
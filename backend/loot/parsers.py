@@ -0,0 +1,30 @@
+import json
+
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from .renderers import JSONRenderer, orjson
+
+
+def loads(data):
+    # For JSON sent as a string inside the request body, e.g. the upload exports
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class JSONParser(parsers.JSONParser):
+    # DRF's JSONParser, with orjson when it is installed.  orjson already rejects NaN and Infinity like strict mode.
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding)
+            return orjson.loads(body)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
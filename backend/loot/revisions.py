@@ -0,0 +1,108 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Max, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import (Player, Wishlist, Item, ClassPrio, IndividualPrio, Raid, Boss, RaidDay, LootHistory,
+                     Revision, Tombstone)
+
+# Every model that appears in an API response.  Each has a Revision row, see migration 0016.
+TRACKED_MODELS = [Player, Wishlist, Item, ClassPrio, IndividualPrio, Raid, Boss, RaidDay, LootHistory]
+# Many-to-many tables, which show up in the responses of the model they hang off
+TRACKED_M2M = [Player.attendance, Player.alts, Item.bosses]
+
+# Delta syncs from a cursor below this row's value have to start over, see force_resync.
+# Starts above 0 so ?since=0 always gets everything.
+RESYNC = 'resync'
+
+
+def _bump(names):
+    # All of the given rows move to one new revision, higher than any revision handed out before,
+    # so the max over a set of tables only ever goes up.  Returns the new revision.
+    latest = Revision.objects.order_by('-value').values('value')[:1]
+    Revision.objects.filter(name__in=names).update(value=Subquery(latest) + 1)
+    return Revision.objects.get(name=names[0]).value
+
+
+def bump(*models):
+    # Call inside the same transaction as the writes, and before them when rows get stamped with the result
+    return _bump([model._meta.model_name for model in models])
+
+
+def force_resync():
+    # For writes that don't stamp rows or leave tombstones (admin edits, cascades), so delta clients reload.
+    # Cursors below the new resync revision start over, so the tombstones they would have read can go.
+    revision = _bump([RESYNC] + [model._meta.model_name for model in TRACKED_MODELS])
+    Tombstone.objects.filter(revision__lt=revision).delete()
+    return revision
+
+
+def current(*models):
+    # The newest revision across the given tables, 0 if none of them have changed yet
+    names = [model._meta.model_name for model in models]
+    return Revision.objects.filter(name__in=names).aggregate(value=Max('value'))['value'] or 0
+
+
+def resync_revision():
+    return Revision.objects.get(name=RESYNC).value
+
+
+def bury(model, ids, revision):
+    Tombstone.objects.bulk_create([
+        Tombstone(model_name=model._meta.model_name, row_id=row_id, revision=revision) for row_id in ids
+    ])
+
+
+def buried_since(model, since):
+    return Tombstone.objects.filter(model_name=model._meta.model_name, revision__gt=since).values_list(
+        'row_id', flat=True)
+
+
+# Writes to tracked tables from anywhere but the API's write views (the admin, the shell, cascades such as
+# deleting a User taking their prios with it) don't stamp rows or leave tombstones, so the receivers below force
+# a resync for them, once per transaction.  The write views bump and stamp revisions themselves and run under
+# managed(), which the receivers leave alone.
+_local = threading.local()
+
+
+@contextmanager
+def managed():
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def _resynced_marker(connection):
+    # The on_commit callback left by this transaction's force_resync, if there was one.  Django drops it on
+    # commit or rollback (and with a rolled back savepoint), which ends the once per transaction.
+    marker = getattr(connection, 'loot_resync_marker', None)
+    return marker is not None and any(entry[1] is marker for entry in connection.run_on_commit)
+
+
+def _unmanaged_write(**kwargs):
+    if getattr(_local, 'depth', 0):
+        return
+    if kwargs.get('action', 'post').startswith('pre'):  # m2m_changed sends pre_add etc. as well
+        return
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and _resynced_marker(connection):
+        return
+    force_resync()
+    if connection.in_atomic_block:
+        connection.loot_resync_marker = lambda: None
+        transaction.on_commit(connection.loot_resync_marker)
+
+
+def track_writes():
+    # Called from LootConfig.ready.  Connected per sender so untracked tables keep Django's fast deletes.
+    for model in TRACKED_MODELS:
+        post_save.connect(_unmanaged_write, sender=model, dispatch_uid=f'revisions_save_{model.__name__}')
+        post_delete.connect(_unmanaged_write, sender=model, dispatch_uid=f'revisions_delete_{model.__name__}')
+    for field in TRACKED_M2M:
+        through = field.through
+        for name, signal in [('save', post_save), ('delete', post_delete), ('m2m', m2m_changed)]:
+            signal.connect(_unmanaged_write, sender=through, dispatch_uid=f'revisions_{name}_{through.__name__}')
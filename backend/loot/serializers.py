@@ -1,4 +1,7 @@
+from bisect import bisect_left
+from datetime import date
 from django.contrib.auth.models import User
+from django.db.models import QuerySet
 from rest_framework import serializers
 
 from .models import Player, Item, Wishlist, Boss, ClassPrio, IndividualPrio, Raid, RaidDay, LootHistory
@@ -13,6 +16,20 @@ class WishlistSerializer(serializers.ModelSerializer):
         fields = ['item_id', 'prio']
 
 
+# Compacts attended RaidDay ids into [first, last] pairs, where each pair covers every id in
+# raid_day_ids (sorted) between first and last.  Keeps regular raiders to a handful of pairs.
+def attendance_ranges(attendance, raid_day_ids):
+    ranges = []
+    previous_index = None
+    for index in sorted(bisect_left(raid_day_ids, raid_day_id) for raid_day_id in attendance):
+        if previous_index is not None and index == previous_index + 1:
+            ranges[-1][1] = raid_day_ids[index]
+        else:
+            ranges.append([raid_day_ids[index], raid_day_ids[index]])
+        previous_index = index
+    return ranges
+
+
 class PlayerSerializer(serializers.ModelSerializer):
     wishlist = WishlistSerializer(many=True)
 
@@ -20,6 +37,13 @@ class PlayerSerializer(serializers.ModelSerializer):
         model = Player
         fields = ['id', 'name', 'notes', 'class', 'role', 'rank', 'is_active', 'attendance', 'wishlist', 'alts']
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        raid_day_ids = self.context.get('raid_day_ids')
+        if raid_day_ids is not None:
+            data['attendance'] = attendance_ranges(data['attendance'], raid_day_ids)
+        return data
+
 
 # Oh reserved keywords, how I love thee
 PlayerSerializer._declared_fields['class'] = serializers.CharField(source='player_class')
@@ -60,11 +84,8 @@ class ItemSerializer(serializers.ModelSerializer):
     class_prio = ClassPrioSerializer(source='class_prios', many=True)
     individual_prio = IndividualPrioSerializer(source='individual_prios', many=True)
     link = serializers.ReadOnlyField()
-    iprio_1 = serializers.SerializerMethodField()
-    iprio_2 = serializers.SerializerMethodField()
-    cprio_1 = serializers.SerializerMethodField()
-    cprio_2 = serializers.SerializerMethodField()
 
+    # iprio_1 ... cprio_2 are read straight from Item's prio summary columns
     class Meta:
         model = Item
         fields = ['id', 'name', 'type', 'tier', 'category', 'notes', 'raid',
@@ -72,32 +93,6 @@ class ItemSerializer(serializers.ModelSerializer):
                   'iprio_1', 'iprio_2', 'cprio_1', 'cprio_2',
                   ]
 
-    def _get_iprio(self, obj, prio):
-        try:
-            i = obj.individual_prios.get(prio=prio)
-            return i.player_id
-        except IndividualPrio.DoesNotExist:
-            return None
-
-    def _get_cprio(self, obj, prio):
-        try:
-            c = obj.class_prios.get(prio=prio)
-            return c.class_name
-        except ClassPrio.DoesNotExist:
-            return None
-
-    def get_iprio_1(self, obj):
-        return self._get_iprio(obj, 1)
-
-    def get_iprio_2(self, obj):
-        return self._get_iprio(obj, 2)
-
-    def get_cprio_1(self, obj):
-        return self._get_cprio(obj, 1)
-
-    def get_cprio_2(self, obj):
-        return self._get_cprio(obj, 2)
-
 
 class RaidSerializer(serializers.ModelSerializer):
     bosses = BossSerializer(queryset=Boss.objects.all(), many=True)
@@ -121,6 +116,102 @@ class LootHistorySerializer(serializers.ModelSerializer):
         fields = ['id', 'item_id', 'player_id', 'raid_day_id']
 
 
+class ValuesSerializer:
+    # Read-only fast path for flat rows, with the same output as the matching ModelSerializer (tests.py checks the
+    # rendered JSON matches byte for byte).  Rows come straight out of values_list() and are zipped with the output
+    # names, skipping DRF's per-field work.  Takes a queryset, a list of instances or one instance, like a serializer.
+    # Output name -> model attribute, in output order
+    fields = {}
+    # Output name -> function for non-null values, e.g. date.isoformat like DRF's DateField
+    converters = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.names = tuple(cls.fields)
+        cls.sources = tuple(cls.fields.values())
+        cls.conversions = tuple((index, cls.converters[name]) for index, name in enumerate(cls.names)
+                                if name in cls.converters)
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    def rows(self, instances):
+        if isinstance(instances, QuerySet):
+            # Prefetches are for the ModelSerializer, and don't apply to values_list()
+            return instances.prefetch_related(None).values_list(*self.sources)
+        return [tuple(getattr(instance, source) for source in self.sources) for instance in instances]
+
+    def to_representation_many(self, instances):
+        names = self.names
+        if not self.conversions:
+            return [dict(zip(names, row)) for row in self.rows(instances)]
+
+        data = []
+        for row in self.rows(instances):
+            row = list(row)
+            for index, convert in self.conversions:
+                if row[index] is not None:
+                    row[index] = convert(row[index])
+            data.append(dict(zip(names, row)))
+        return data
+
+    @property
+    def data(self):
+        if self.many:
+            return self.to_representation_many(self.instance)
+        return self.to_representation_many([self.instance])[0]
+
+
+class PlayerValuesSerializer(ValuesSerializer):
+    # PlayerSerializer, with wishlist, attendance and alts read as one values_list() each
+    fields = {'id': 'id', 'name': 'name', 'notes': 'notes', 'class': 'player_class', 'role': 'role', 'rank': 'rank',
+              'is_active': 'is_active'}
+
+    def to_representation_many(self, instances):
+        players = super().to_representation_many(instances)
+        ids = [player['id'] for player in players]
+        if not ids:
+            return players
+
+        wishlists = {}
+        for player_id, item_id, priority in (Wishlist.objects.filter(player_id__in=ids)
+                                             .values_list('player_id', 'item_id', 'priority')):
+            wishlists.setdefault(player_id, []).append({'item_id': item_id, 'prio': priority})
+
+        # In RaidDay's ordering, the same as the prefetched attendance
+        attendance = {}
+        for player_id, raid_day_id in (Player.attendance.through.objects.filter(player_id__in=ids)
+                                       .order_by('-raidday__date', '-raidday_id')
+                                       .values_list('player_id', 'raidday_id')):
+            attendance.setdefault(player_id, []).append(raid_day_id)
+
+        alts = {}
+        for player_id, alt_id in (Player.alts.through.objects.filter(from_player_id__in=ids)
+                                  .values_list('from_player_id', 'to_player_id')):
+            alts.setdefault(player_id, []).append(alt_id)
+
+        raid_day_ids = self.context.get('raid_day_ids')
+        for player in players:
+            player_attendance = attendance.get(player['id'], [])
+            if raid_day_ids is not None:
+                player_attendance = attendance_ranges(player_attendance, raid_day_ids)
+            player['attendance'] = player_attendance
+            player['wishlist'] = wishlists.get(player['id'], [])
+            player['alts'] = alts.get(player['id'], [])
+        return players
+
+
+class RaidDayValuesSerializer(ValuesSerializer):
+    fields = {'id': 'id', 'name': 'name', 'date': 'date', 'raid_id': 'raid_id'}
+    converters = {'date': date.isoformat}
+
+
+class LootHistoryValuesSerializer(ValuesSerializer):
+    fields = {'id': 'id', 'item_id': 'item_id', 'player_id': 'player_id', 'raid_day_id': 'raid_day_id'}
+
+
 class CurrentUserSerializer(serializers.ModelSerializer):
     player = serializers.SerializerMethodField()
 
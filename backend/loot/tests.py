@@ -1,8 +1,31 @@
-from datetime import date
+import gzip
+import io
+import json
+import multiprocessing
+import re
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import mock
+from django.db import connection, transaction
 from django.contrib.auth.models import User
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from rest_framework import renderers as drf_renderers
+from rest_framework.exceptions import ParseError
 from rest_framework.test import APITestCase
 
-from .models import Player, LootHistory, Raid, RaidDay, Item, Boss, ClassPrio, IndividualPrio, Wishlist
+from .models import (Player, LootHistory, Raid, RaidDay, Item, Boss, ClassPrio, IndividualPrio, Wishlist,
+                     Tombstone)
+from . import cache, metrics, parsers, renderers, revisions
+from .db import tune_sqlite
+from .importer import Importer
+from .serializers import (PlayerSerializer, PlayerValuesSerializer, RaidDaySerializer, RaidDayValuesSerializer,
+                          LootHistorySerializer, LootHistoryValuesSerializer)
+from .views import update_inactive_players
 
 
 def setup_test_data():
@@ -45,7 +68,37 @@ def setup_test_data():
     LootHistory.objects.create(id=2, raid_day=aq1, item=tear, player=morb)
 
 
-class GetTests(APITestCase):
+PLAYER_NAMES = {100: "Nesingtick", 200: "Morbidmind"}
+# id -> (name, date, raid id)
+RAID_DAYS = {50: ("BWL 1", date(2020, 2, 18), 1), 60: ("AQ 1", date(2020, 8, 9), 2)}
+
+
+def setup_guild(items=None, players=(100,), raid_days=(50,), **user_fields):
+    # The bare guild most tests start from: Blackwing Lair (1) and Ahn'Qiraj (2), "item <id>" for each
+    # {item id: raid id}, the given players and raid days, and the superuser nesingtick / test_password
+    raids = [Raid.objects.create(id=1, name="Blackwing Lair", short_name="BWL"),
+             Raid.objects.create(id=2, name="Ahn'Qiraj", short_name="AQ")]
+    for item_id, raid_id in (items if items is not None else {10: 1}).items():
+        Item.objects.create(id=item_id, name=f"item {item_id}", type="t", category=Item.Categories.CASTER,
+                            raid_id=raid_id)
+    for player_id in players:
+        Player.objects.create(id=player_id, name=PLAYER_NAMES[player_id])
+    for raid_day_id in raid_days:
+        name, raid_day_date, raid_id = RAID_DAYS[raid_day_id]
+        RaidDay.objects.create(id=raid_day_id, name=name, date=raid_day_date, raid_id=raid_id)
+    User.objects.create_user('nesingtick', password='test_password', is_superuser=True, **user_fields)
+    return raids
+
+
+class LootTestCase(APITestCase):
+    # Every test starts with an empty response cache, since it lives outside the database
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+
+class GetTests(LootTestCase):
 
     def setUp(self):
         setup_test_data()
@@ -260,6 +313,15 @@ class LoginTests(APITestCase):
         user = User.objects.get(username='david')
         self.assertEqual(player.user, user)
 
+    def test_signup_new_player_matches_existing_name(self):
+        Player.objects.create(id=5, name='David', player_class=Player.Classes.HUNTER)
+
+        data = {'new': True, 'player_name': 'DAVID', 'class': 'PL', 'role': 'H', 'password': 'test_password'}
+        response = self.client.post('/signup', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['player']['id'], 5)
+        self.assertEqual(Player.objects.count(), 1)
+
     def test_login(self):
         data = {'new': True,
                 'player_name': 'dAvId',
@@ -317,20 +379,10 @@ class LoginTests(APITestCase):
         self.assertEqual(response.data['player']['permission_level'], 0)
 
 
-class LootHistoryTests(APITestCase):
+class LootHistoryTests(LootTestCase):
 
     def setUp(self):
-        bwl = Raid.objects.create(id=1, name="Blackwing Lair", short_name="BWL")
-        aq = Raid.objects.create(id=2, name="Ahn'Qiraj", short_name="AQ")
-        Item.objects.create(id=10, name="item 10", type="t", category=Item.Categories.CASTER, raid=bwl)
-        Item.objects.create(id=20, name="item 20", type="u", category=Item.Categories.CASTER, raid=aq)
-        Player.objects.create(id=100, name="Nesingtick")
-        Player.objects.create(id=200, name="Morbidmind")
-        RaidDay.objects.create(id=50, name="BWL 1", date=date(2020, 2, 18), raid=bwl)
-        RaidDay.objects.create(id=60, name="AQ 1", date=date(2020, 8, 9), raid=aq)
-
-        User.objects.create_user('nesingtick', password='test_password', is_superuser=True)
-
+        setup_guild(items={10: 1, 20: 2}, players=(100, 200), raid_days=(50, 60))
         super().setUp()
 
     def test_add_loot_history(self):
@@ -343,11 +395,13 @@ class LootHistoryTests(APITestCase):
         }}
         self.client.login(username='nesingtick', password='test_password')
         response = self.client.post('/api/addLootHistory', data, format='json')
-        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.status_code, 200)
 
         self.assertEqual(LootHistory.objects.count(), 1)
 
         lh = LootHistory.objects.all()[0]
+        self.assertEqual(response.data['rows'], [{'id': lh.id, 'item_id': 10, 'player_id': 100, 'raid_day_id': 50}])
+        self.assertEqual(response.data['revision'], lh.revision)
         self.assertEqual(lh.item, Item.objects.get(id=10))
         self.assertEqual(lh.player, Player.objects.get(id=100))
         self.assertEqual(lh.raid_day, RaidDay.objects.get(id=50))
@@ -364,7 +418,8 @@ class LootHistoryTests(APITestCase):
         }}
         self.client.login(username='nesingtick', password='test_password')
         response = self.client.post('/api/updateLootHistory', data, format='json')
-        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], [data['row']])
 
         self.assertEqual(LootHistory.objects.count(), 1)
 
@@ -381,6 +436,1306 @@ class LootHistoryTests(APITestCase):
 
         self.client.login(username='nesingtick', password='test_password')
         response = self.client.post('/api/deleteLootHistory', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], [])
+        self.assertEqual(response.data['deleted'], [1])
+
+        self.assertEqual(LootHistory.objects.count(), 0)
+
+    def test_batch_loot_history(self):
+        LootHistory.objects.create(id=1, item_id=10, player_id=100, raid_day_id=50)
+        LootHistory.objects.create(id=2, item_id=10, player_id=200, raid_day_id=50)
+
+        data = {'operations': [
+            {'op': 'add', 'row': {'item_id': 20, 'player_id': 100, 'raid_day_id': 60}},
+            {'op': 'add', 'row': {'item_id': 20, 'player_id': 200, 'raid_day_id': 60}},
+            {'op': 'update', 'row': {'id': 1, 'item_id': 20, 'player_id': 200, 'raid_day_id': 60}},
+            {'op': 'delete', 'id': 2},
+        ]}
+        self.client.login(username='nesingtick', password='test_password')
+        response = self.client.post('/api/batchLootHistory', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(response.data['deleted'], [2])
+        self.assertCountEqual([(row['item_id'], row['player_id'], row['raid_day_id']) for row in response.data['rows']],
+                              [(20, 100, 60), (20, 200, 60), (20, 200, 60)])
+        self.assertCountEqual(LootHistory.objects.values_list('item_id', 'player_id', 'raid_day_id'),
+                              [(20, 100, 60), (20, 200, 60), (20, 200, 60)])
+
+    def test_batch_loot_history_is_all_or_nothing(self):
+        LootHistory.objects.create(id=1, item_id=10, player_id=100, raid_day_id=50)
+
+        data = {'operations': [
+            {'op': 'delete', 'id': 1},
+            {'op': 'update', 'row': {'id': 5, 'item_id': 20, 'player_id': 200, 'raid_day_id': 60}},
+        ]}
+        self.client.login(username='nesingtick', password='test_password')
+        response = self.client.post('/api/batchLootHistory', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(LootHistory.objects.count(), 1)
+
+        response = self.client.post('/api/batchLootHistory', {'operations': [{'op': 'merge'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_loot_history_rejects_malformed_operations(self):
+        LootHistory.objects.create(id=1, item_id=10, player_id=100, raid_day_id=50)
+        revision = revisions.current(LootHistory)
+
+        self.client.login(username='nesingtick', password='test_password')
+        for operations in [
+            None,
+            [{'row': {'item_id': 20, 'player_id': 100, 'raid_day_id': 60}}],
+            [{'op': 'add'}],
+            [{'op': 'add', 'row': {'item_id': 20, 'player_id': 100}}],
+            [{'op': 'update', 'row': {'item_id': 1}}],
+            [{'op': 'update', 'row': {'item_id': 20, 'player_id': 200, 'raid_day_id': 60}}],
+            [{'op': 'delete', 'id': 1}, {'op': 'delete'}],
+        ]:
+            response = self.client.post('/api/batchLootHistory', {'operations': operations}, format='json')
+            self.assertEqual(response.status_code, 400, operations)
+            self.assertIn('operations', response.data)
+
+        self.assertEqual(LootHistory.objects.count(), 1)
+        self.assertEqual(revisions.current(LootHistory), revision)
+
+    def test_empty_batch_does_not_bump(self):
+        revision = revisions.current(LootHistory, RaidDay)
+
+        self.client.login(username='nesingtick', password='test_password')
+        response = self.client.post('/api/batchLootHistory', {'operations': []}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'revision': revision, 'rows': [], 'deleted': []})
+        self.assertEqual(revisions.current(LootHistory, RaidDay), revision)
+
+    def test_batch_loot_history_needs_every_permission(self):
+        User.objects.create_user('morbidmind', password='test_password')
+        self.client.login(username='morbidmind', password='test_password')
+        data = {'operations': [{'op': 'add', 'row': {'item_id': 20, 'player_id': 100, 'raid_day_id': 60}}]}
+        response = self.client.post('/api/batchLootHistory', data, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(LootHistory.objects.count(), 0)
+
+
+class QueryCountTests(LootTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="nesingtick", password="test_password", is_superuser=True)
+        self.raid = Raid.objects.create(id=1, name="Blackwing Lair", short_name="BWL")
+        self.bosses = [Boss.objects.create(name=f"Boss {n}", raid=self.raid, order=n) for n in range(3)]
+        self.players = [Player.objects.create(name=f"Player{n}") for n in range(3)]
+        super().setUp()
+
+    def add_items(self, count):
+        start = Item.objects.count()
+        for n in range(start, start + count):
+            item = Item.objects.create(name=f"Item {n}", type="Trinket", category=Item.Categories.CASTER,
+                                       raid=self.raid)
+            item.bosses.add(*self.bosses[:n % 3 + 1])
+            ClassPrio.objects.create(item=item, class_name="Hunters", prio=1, set_by=self.user)
+            ClassPrio.objects.create(item=item, class_name="Rogues", prio=2, set_by=self.user)
+            IndividualPrio.objects.create(item=item, player=self.players[n % 3], prio=1, set_by=self.user)
+        revisions.bump(Item, ClassPrio, IndividualPrio)
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response
+
+    def test_get_items_query_count_is_constant(self):
+        self.add_items(5)
+        small_count, response = self.count_queries('/api/getItems/')
+        self.assertEqual(len(response.data), 5)
+
+        self.add_items(45)
+        large_count, response = self.count_queries('/api/getItems/')
+        self.assertEqual(len(response.data), 50)
+
+        self.assertEqual(small_count, large_count)
+
+        item = next(i for i in response.data if i['name'] == 'Item 4')
+        self.assertEqual(item['bosses'], ['Boss 0', 'Boss 1'])
+        self.assertEqual(item['cprio_1'], 'Hunters')
+        self.assertEqual(item['cprio_2'], 'Rogues')
+        self.assertEqual(item['iprio_1'], self.players[1].id)
+        self.assertEqual(item['iprio_2'], None)
+
+    def add_players(self, count):
+        raid_days = [RaidDay.objects.create(name=f"BWL {n}", date=date(2020, 2, n + 1), raid=self.raid)
+                     for n in range(3)]
+        item = Item.objects.create(name=f"Item {Item.objects.count()}", type="Trinket",
+                                   category=Item.Categories.CASTER, raid=self.raid)
+        start = Player.objects.count()
+        for n in range(start, start + count):
+            player = Player.objects.create(name=f"Player{n}")
+            player.attendance.add(*raid_days)
+            player.alts.add(self.players[n % 3])
+            Wishlist.objects.create(player=player, item=item, priority=1)
+        revisions.bump(Player, Wishlist, RaidDay)
+
+    def test_get_players_query_count_is_constant(self):
+        self.add_players(5)
+        small_count, response = self.count_queries('/api/getPlayers/')
+        self.assertEqual(len(response.data), 8)
+
+        self.add_players(45)
+        large_count, response = self.count_queries('/api/getPlayers/')
+        self.assertEqual(len(response.data), 53)
+
+        self.assertEqual(small_count, large_count)
+
+        player = next(p for p in response.data if p['name'] == 'Player4')
+        self.assertEqual(len(player['attendance']), 3)
+        self.assertEqual(player['alts'], [self.players[1].id])
+        self.assertEqual(len(player['wishlist']), 1)
+
+    def test_get_players_attendance_ranges(self):
+        raid_days = [RaidDay.objects.create(name=f"BWL {n}", date=date(2020, 2, n + 1), raid=self.raid)
+                     for n in range(6)]
+        self.players[0].attendance.add(*raid_days[0:3], raid_days[4])
+        raid_days[1].delete()
+        revisions.bump(Player, RaidDay)
+
+        response = self.client.get('/api/getPlayers/?attendance=ranges')
+        self.assertEqual(response.status_code, 200)
+        player = next(p for p in response.data if p['id'] == self.players[0].id)
+        self.assertEqual(player['attendance'], [[raid_days[0].id, raid_days[2].id], [raid_days[4].id, raid_days[4].id]])
+        player = next(p for p in response.data if p['id'] == self.players[1].id)
+        self.assertEqual(player['attendance'], [])
+
+
+class ResponseCacheTests(LootTestCase):
+
+    def setUp(self):
+        setup_guild()
+        super().setUp()
+
+    def test_repeat_get_skips_serializer(self):
+        response = self.client.get('/api/getLootHistory/')
+        self.assertEqual(response.json(), [])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/getLootHistory/')
+        self.assertEqual(response.json(), [])
+        # Only the revision lookup
+        self.assertEqual(len(context), 1)
+
+    def test_write_invalidates_only_affected_views(self):
+        self.client.get('/api/getLootHistory/')
+        self.client.get('/api/getItems/')
+
+        self.client.login(username='nesingtick', password='test_password')
+        data = {'row': {'item_id': 10, 'player_id': 100, 'raid_day_id': 50}}
+        response = self.client.post('/api/addLootHistory', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.logout()
+
+        response = self.client.get('/api/getLootHistory/')
+        self.assertEqual(len(response.json()), 1)
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/getItems/')
+        self.assertEqual(len(context), 1)
+
+    def test_bump_is_monotonic_across_tables(self):
+        first = revisions.bump(Item)
+        second = revisions.bump(Player)
+        self.assertGreater(second, first)
+        self.assertEqual(revisions.current(Item), first)
+        self.assertEqual(revisions.current(Item, Player), second)
+
+    def test_matching_etag_returns_304_without_queryset(self):
+        response = self.client.get('/api/getPlayers/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/getPlayers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(context), 1)
+
+        response = self.client.get('/api/getPlayers/100/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        revisions.bump(Player)
+        response = self.client.get('/api/getPlayers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unused_query_params_share_an_entry(self):
+        for n in range(20):
+            self.client.get(f'/api/getItems/?junk={n}')
+        self.assertEqual(len(cache._responses), 1)
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/getItems/?junk=new&cprio_1=Hunters')
+        self.assertGreater(len(context), 1)
+        self.assertEqual(len(cache._responses), 2)
+
+    def test_old_revisions_are_dropped(self):
+        self.client.get('/api/getItems/')
+        self.client.get('/api/getItems/?cprio_1=Hunters')
+        self.client.get('/api/getPlayers/')
+        revisions.bump(Item)
+        self.client.get('/api/getItems/')
+        self.assertEqual(sorted(key[0] for key in cache._responses), ['ItemViewSet', 'PlayerViewSet'])
+
+    def test_cache_is_capped(self):
+        with mock.patch.object(cache, 'MAX_CACHED_RESPONSES', 3):
+            for n in range(1, 6):
+                self.client.get(f'/api/getLootHistory/?page_size={n}')
+            self.assertEqual([dict(key[1])['page_size'] for key in cache._responses], [('3',), ('4',), ('5',)])
+
+            # A hit makes an entry the most recently used
+            self.client.get('/api/getLootHistory/?page_size=3')
+            self.client.get('/api/getLootHistory/?page_size=6')
+            self.assertEqual([dict(key[1])['page_size'] for key in cache._responses], [('5',), ('3',), ('6',)])
+
+    def test_etag_differs_by_format(self):
+        json_etag = self.client.get('/api/getRaids/')['ETag']
+        html_etag = self.client.get('/api/getRaids/', HTTP_ACCEPT='text/html')['ETag']
+        self.assertNotEqual(json_etag, html_etag)
+
+
+class DeltaSyncTests(LootTestCase):
+
+    def setUp(self):
+        setup_guild(items={10: 1, 20: 1}, players=(100, 200))
+        LootHistory.objects.create(id=1, item_id=10, player_id=100, raid_day_id=50)
+        LootHistory.objects.create(id=2, item_id=20, player_id=200, raid_day_id=50)
+        self.client.login(username='nesingtick', password='test_password')
+        super().setUp()
+
+    def test_since_zero_is_full_reset(self):
+        response = self.client.get('/api/getLootHistory/?since=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['reset'])
+        self.assertEqual([row['id'] for row in response.data['rows']], [2, 1])
+        self.assertEqual(response.data['deleted'], [])
+
+    def test_reset_ignores_page_size(self):
+        response = self.client.get('/api/getLootHistory/?since=0&page_size=1')
+        self.assertTrue(response.data['reset'])
+        self.assertEqual([row['id'] for row in response.data['rows']], [2, 1])
+
+    def test_loot_history_delta(self):
+        since = self.client.get('/api/getLootHistory/?since=0').data['revision']
+
+        data = {'row': {'item_id': 20, 'player_id': 100, 'raid_day_id': 50}}
+        self.client.post('/api/addLootHistory', data, format='json')
+        self.client.post('/api/deleteLootHistory', {'id': 1}, format='json')
+
+        response = self.client.get(f'/api/getLootHistory/?since={since}')
+        self.assertFalse(response.data['reset'])
+        self.assertEqual(len(response.data['rows']), 1)
+        self.assertEqual(response.data['rows'][0]['player_id'], 100)
+        self.assertEqual(response.data['deleted'], [1])
+        self.assertGreater(response.data['revision'], since)
+
+        response = self.client.get(f"/api/getLootHistory/?since={response.data['revision']}")
+        self.assertEqual(response.data['rows'], [])
+        self.assertEqual(response.data['deleted'], [])
+
+    def test_player_delta(self):
+        since = self.client.get('/api/getPlayers/?since=0').data['revision']
+
+        data = {'player': {'id': 200, 'name': 'Morbidmind', 'class': 'WL', 'rank': 80, 'notes': 'hi', 'role': 'D',
+                           'attendance': [50], 'wishlist': [{'item_id': 10, 'prio': 1}]}}
+        response = self.client.post('/api/updatePlayer', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'][0]['notes'], 'hi')
+
+        response = self.client.get(f'/api/getPlayers/?since={since}')
+        self.assertEqual([row['id'] for row in response.data['rows']], [200])
+        self.assertEqual(response.data['rows'][0]['wishlist'], [{'item_id': 10, 'prio': 1}])
+
+    def test_forced_resync(self):
+        since = self.client.get('/api/getLootHistory/?since=0').data['revision']
+        revisions.force_resync()
+        response = self.client.get(f'/api/getLootHistory/?since={since}')
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(len(response.data['rows']), 2)
+
+    def test_forced_resync_prunes_tombstones(self):
+        self.client.post('/api/deleteLootHistory', {'id': 1}, format='json')
+        self.assertEqual(Tombstone.objects.count(), 1)
+        revision = revisions.force_resync()
+        self.assertEqual(Tombstone.objects.count(), 0)
+
+        self.client.post('/api/deleteLootHistory', {'id': 2}, format='json')
+        response = self.client.get(f'/api/getLootHistory/?since={revision}')
+        self.assertEqual(response.data['deleted'], [2])
+
+    def test_invalid_since(self):
+        response = self.client.get('/api/getLootHistory/?since=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTests(LootTestCase):
+
+    def setUp(self):
+        bwl, _ = setup_guild(raid_days=())
+        # Five raid days with four drops each, so pages split both between and within days
+        for day in range(1, 6):
+            RaidDay.objects.create(id=day, name=f"BWL {day}", date=date(2020, 2, day), raid=bwl)
+            for n in range(4):
+                LootHistory.objects.create(id=day * 10 + n, item_id=10, player_id=100, raid_day_id=day)
+        super().setUp()
+
+    def get_pages(self, page_size):
+        ids, path = [], f'/api/getLootHistory/?page_size={page_size}'
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            path = response.data['next']
+        return ids
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get('/api/getLootHistory/')
+        self.assertEqual(len(response.data), 20)
+
+    def test_pages_cover_history_in_order(self):
+        expected = [day * 10 + n for day in range(5, 0, -1) for n in range(3, -1, -1)]
+        for page_size in [1, 3, 4, 7, 20, 50]:
+            self.assertEqual(self.get_pages(page_size), expected)
+
+    def test_last_page_has_no_next(self):
+        response = self.client.get('/api/getLootHistory/?page_size=20')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_follows_raid_day_date_change(self):
+        raid_day = RaidDay.objects.get(id=1)
+        raid_day.date = date(2020, 3, 1)
+        raid_day.save()
+        revisions.bump(RaidDay)
+        self.assertEqual(self.get_pages(6)[:4], [13, 12, 11, 10])
+
+    def test_deep_page_same_query_count(self):
+        with CaptureQueriesContext(connection) as first_queries:
+            first = self.client.get('/api/getLootHistory/?page_size=2')
+        with CaptureQueriesContext(connection) as deep_queries:
+            deep = self.client.get('/api/getLootHistory/?page_size=2&cursor=2020-02-01.12')
+        self.assertIn('cursor=2020-02-05.52', first.data['next'])
+        self.assertEqual([row['id'] for row in deep.data['results']], [11, 10])
+        self.assertEqual(len(first_queries), len(deep_queries))
+
+    def test_next_link_is_relative(self):
+        self.client.get('/api/getLootHistory/?page_size=2&junk=1', HTTP_HOST='localhost', secure=True)
+        response = self.client.get('/api/getLootHistory/?page_size=2')
+        self.assertEqual(response.data['next'], '/api/getLootHistory/?page_size=2&cursor=2020-02-05.52')
+
+    def test_invalid_parameters(self):
+        for query in ['page_size=0', 'page_size=ten', 'page_size=2&cursor=43', 'page_size=2&cursor=2020-13-01.4']:
+            response = self.client.get(f'/api/getLootHistory/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class QueryPlanTests(LootTestCase):
+    # Every filtered statement the API runs has to find its rows through an index.  Only tables that don't
+    # grow with the guild may be scanned, and statements without a WHERE read every row on purpose.
+    # Sorted lists may walk their ordering index, but reading a whole index just to filter it (a covering
+    # index scan, as a lookup on lower(name) gets) counts as a full scan.
+    fixed_size_tables = {'loot_revision'}
+
+    def setUp(self):
+        setup_test_data()
+        User.objects.create_user('admin', password='test_password', is_superuser=True, is_staff=True)
+        self.client.login(username='admin', password='test_password')
+        super().setUp()
+
+    def assertNoFullScans(self, context):
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')) or ' WHERE ' not in sql:
+                    continue
+                aliases = dict((alias, table) for table, alias in re.findall(r'"(\w+)" (U\d+)', sql))
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for *_, detail in cursor.fetchall():
+                    scan = re.fullmatch(r'SCAN (\w+)( USING COVERING INDEX \w+)?', detail)
+                    if scan:
+                        self.assertIn(aliases.get(scan[1], scan[1]), self.fixed_size_tables, sql)
+
+    def test_reads(self):
+        for path in ['/api/getItems/', '/api/getPlayers/', '/api/getPlayers/?attendance=ranges',
+                     '/api/getRaids/', '/api/getRaidDays/', '/api/getLootHistory/',
+                     '/api/getLootHistory/?page_size=1', '/api/getLootHistory/?page_size=1&cursor=2020-08-09.2',
+                     '/api/getPlayers/?since=1', '/api/getLootHistory/?since=1']:
+            with self.subTest(path=path):
+                cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    self.assertEqual(self.client.get(path).status_code, 200)
+                self.assertNoFullScans(context)
+
+    def test_writes(self):
+        player = {'id': 200, 'name': 'Morbidmind', 'class': 'WL', 'rank': 80, 'role': 'D', 'notes': '',
+                  'wishlist': [{'item_id': 10, 'prio': 1}], 'attendance': [50]}
+        item = {'id': 10, 'tier': None, 'category': 'CS', 'notes': '',
+                'class_prio': [{'class': 'Paladin', 'prio': 1}], 'individual_prio': [{'player_id': 200, 'prio': 1}]}
+        loot = [{'player': 'Morbidmind-Faerlina', 'itemID': 10, 'class': 'WARLOCK', 'response': 'Mainspec'}]
+        requests = [
+            ('/api/updatePlayer', {'player': player}),
+            ('/api/updateItem', {'item': item}),
+            ('/api/addLootHistory', {'row': {'item_id': 20, 'player_id': 200, 'raid_day_id': 50}}),
+            ('/api/updateLootHistory', {'row': {'id': 1, 'item_id': 20, 'player_id': 100, 'raid_day_id': 60}}),
+            ('/api/deleteLootHistory', {'id': 2}),
+            ('/api/batchLootHistory', {'operations': [
+                {'op': 'add', 'row': {'item_id': 10, 'player_id': 300, 'raid_day_id': 60}},
+                {'op': 'update', 'row': {'id': 1, 'item_id': 10, 'player_id': 100, 'raid_day_id': 50}},
+                {'op': 'delete', 'id': 1},
+            ]}),
+            ('/api/uploadAttendance', {'raid_day_id': 50, 'data': 'Nesingtick-HUNTER,Newbie-PRIEST'}),
+            ('/api/uploadLootHistory', {'raid_day_id': 50, 'data': json.dumps(loot)}),
+        ]
+        for path, data in requests:
+            with self.subTest(path=path):
+                with CaptureQueriesContext(connection) as context:
+                    self.assertIn(self.client.post(path, data, format='json').status_code, (200, 204))
+                self.assertNoFullScans(context)
+
+
+class UploadTests(LootTestCase):
+
+    def setUp(self):
+        self.bwl, self.aq = setup_guild(items={10: 1, 11: 1, 20: 2}, players=(100, 200), is_staff=True)
+        Player.objects.filter(id=100).update(is_active=False)
+        user = User.objects.get(username='nesingtick')
+        Wishlist.objects.create(player_id=100, item_id=10, priority=1)
+        Wishlist.objects.create(player_id=100, item_id=11, priority=2)
+        Wishlist.objects.create(player_id=200, item_id=10, priority=1)
+        IndividualPrio.objects.create(player_id=100, item_id=10, prio=1, set_by=user)
+        self.client.login(username='nesingtick', password='test_password')
+        super().setUp()
+
+    def upload_loot_history(self, rows, raid_day_id=50):
+        data = {'raid_day_id': raid_day_id, 'data': json.dumps(rows)}
+        response = self.client.post('/api/uploadLootHistory', data, format='json')
         self.assertEqual(response.status_code, 204)
 
+    def test_upload_loot_history(self):
+        self.upload_loot_history([
+            {'player': 'nesingtick-Faerlina', 'itemID': 10, 'class': 'HUNTER', 'response': 'Mainspec'},
+            {'player': 'Newbie-Faerlina', 'itemID': '11', 'class': 'PRIEST', 'response': 'Offspec'},
+            {'player': 'Morbidmind-Faerlina', 'itemID': 11, 'class': 'WARLOCK', 'response': 'Disenchant'},
+            {'player': 'Morbidmind-Faerlina', 'itemID': 20, 'class': 'WARLOCK', 'response': 'Mainspec'},
+        ])
+
+        newbie = Player.objects.get(name='Newbie')
+        self.assertEqual(newbie.player_class, Player.Classes.PRIEST)
+        self.assertCountEqual(LootHistory.objects.values_list('player_id', 'item_id', 'raid_day_id'),
+                              [(100, 10, 50), (newbie.id, 11, 50)])
+        self.assertCountEqual(Wishlist.objects.values_list('player_id', 'item_id'), [(100, 11), (200, 10)])
+        self.assertEqual(IndividualPrio.objects.count(), 0)
+        self.assertTrue(Player.objects.get(id=100).is_active)
+
+    def test_upload_loot_history_rejects_unknown_items(self):
+        rows = [{'player': 'Nesingtick', 'itemID': 10, 'class': 'HUNTER', 'response': 'Mainspec'},
+                {'player': 'Newbie', 'itemID': 99, 'class': 'PRIEST', 'response': 'Mainspec'}]
+        response = self.client.post('/api/uploadLootHistory', {'raid_day_id': 50, 'data': json.dumps(rows)},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('99', str(response.data['data']))
         self.assertEqual(LootHistory.objects.count(), 0)
+        self.assertFalse(Player.objects.filter(name='Newbie').exists())
+
+    def test_upload_loot_history_query_count_is_constant(self):
+        def rows(count):
+            return [{'player': f'Player{n}-Faerlina', 'itemID': 10 + n % 2, 'class': 'MAGE', 'response': 'Mainspec'}
+                    for n in range(count)]
+
+        with CaptureQueriesContext(connection) as small:
+            self.upload_loot_history(rows(10))
+        LootHistory.objects.all().delete()
+        Player.objects.filter(name__startswith='Player').delete()
+        # Kept under SQLite's 999 variables per statement, past which bulk_create splits its insert
+        with CaptureQueriesContext(connection) as large:
+            self.upload_loot_history(rows(50))
+
+        self.assertEqual(LootHistory.objects.count(), 50)
+        self.assertEqual(len(small), len(large))
+
+    def upload_attendance(self, data, raid_day_id=50):
+        data = {'raid_day_id': raid_day_id, 'data': data}
+        response = self.client.post('/api/uploadAttendance', data, format='json')
+        self.assertEqual(response.status_code, 204)
+
+    def test_upload_attendance(self):
+        Player.objects.get(id=200).attendance.add(50)
+        self.upload_attendance('nesingtick-HUNTER,Morbidmind-WARLOCK,Newbie-PRIEST')
+
+        newbie = Player.objects.get(name='Newbie')
+        self.assertEqual(newbie.player_class, Player.Classes.PRIEST)
+        self.assertCountEqual(RaidDay.objects.get(id=50).player_set.values_list('id', flat=True), [100, 200, newbie.id])
+        self.assertTrue(Player.objects.get(id=100).is_active)
+
+    def test_name_key_follows_renames(self):
+        player = Player.objects.get(id=100)
+        player.name = 'Nesingtock'
+        player.save()
+        self.assertEqual(player.name_key, 'nesingtock')
+
+        self.upload_attendance('NESINGTOCK-HUNTER')
+        self.assertEqual(list(RaidDay.objects.get(id=50).player_set.values_list('id', flat=True)), [100])
+        self.assertFalse(Player.objects.filter(name_key='nesingtick').exists())
+
+    def test_upload_attendance_snapshots(self):
+        self.upload_attendance(['Nesingtick-HUNTER,Newbie-PRIEST', 'Nesingtick-HUNTER,Latecomer-MAGE'])
+        self.assertEqual(RaidDay.objects.get(id=50).player_set.count(), 3)
+
+        data = {'raid_day_id': 'New', 'raid_day_name': 'BWL 2', 'date': '2020-02-25', 'raid_id': 1,
+                'data': 'Nesingtick-HUNTER\nMorbidmind-WARLOCK,Newbie-PRIEST\n'}
+        response = self.client.post('/api/uploadAttendance', data, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(RaidDay.objects.get(name='BWL 2').player_set.count(), 3)
+
+    def test_upload_attendance_query_count_is_constant(self):
+        def roster(count):
+            return ','.join(f'Player{n}-MAGE' for n in range(count))
+
+        with CaptureQueriesContext(connection) as small:
+            self.upload_attendance(roster(4))
+        with CaptureQueriesContext(connection) as large:
+            self.upload_attendance(roster(40))
+
+        self.assertEqual(RaidDay.objects.get(id=50).player_set.count(), 40)
+        self.assertEqual(len(small), len(large))
+
+    def test_upload_attendance_updates_last_attended_and_is_active(self):
+        older = RaidDay.objects.create(id=40, name="BWL 0", date=date(2020, 2, 11), raid=self.bwl)
+        newer = RaidDay.objects.create(id=60, name="BWL 2", date=date(2020, 2, 25), raid=self.bwl)
+        Player.objects.filter(id=200).update(last_attended=newer)
+
+        self.upload_attendance('Nesingtick-HUNTER,Morbidmind-WARLOCK', raid_day_id=50)
+        self.assertEqual(Player.objects.get(id=100).last_attended_id, 50)
+        self.assertEqual(Player.objects.get(id=200).last_attended_id, 60)
+
+        with self.settings(INACTIVE_AFTER_RAID_DAYS=2):
+            self.upload_attendance('Morbidmind-WARLOCK', raid_day_id=older.id)
+
+        # Nesingtick's last raid (50) is still one of the newest 2, Morbidmind was never removed
+        self.assertTrue(Player.objects.get(id=100).is_active)
+        self.assertTrue(Player.objects.get(id=200).is_active)
+
+        RaidDay.objects.create(id=70, name="BWL 3", date=date(2020, 3, 3), raid=self.bwl)
+        Player.objects.create(id=300, name="Ghost")
+        with self.settings(INACTIVE_AFTER_RAID_DAYS=2):
+            self.upload_attendance('Newbie-PRIEST', raid_day_id=70)
+
+        self.assertFalse(Player.objects.get(id=100).is_active)
+        self.assertTrue(Player.objects.get(id=200).is_active)
+        self.assertTrue(Player.objects.get(name='Newbie').is_active)
+        self.assertFalse(Player.objects.get(id=300).is_active)
+
+    def test_upload_attendance_only_stamps_changed_players(self):
+        self.upload_attendance('Nesingtick-HUNTER')
+        stamped = Player.objects.get(id=100).revision
+
+        # Nesingtick's attendance, last_attended and is_active are all unchanged
+        self.upload_attendance('Nesingtick-HUNTER,Morbidmind-WARLOCK')
+        self.assertEqual(Player.objects.get(id=100).revision, stamped)
+        self.assertGreater(Player.objects.get(id=200).revision, stamped)
+
+        Player.objects.filter(id=100).update(is_active=False)
+        self.upload_attendance('Nesingtick-HUNTER')
+        self.assertGreater(Player.objects.get(id=100).revision, stamped)
+        self.assertTrue(Player.objects.get(id=100).is_active)
+
+
+class UpdatePlayerTests(LootTestCase):
+
+    def setUp(self):
+        bwl, _ = setup_guild(items={n: 1 for n in range(1, 15)}, raid_days=())
+        self.raid_days = [RaidDay.objects.create(id=n, name=f"BWL {n}", date=date(2020, 1, n), raid=bwl)
+                          for n in range(1, 31)]
+        self.player = Player.objects.get(id=100)
+        self.client.login(username='nesingtick', password='test_password')
+        super().setUp()
+
+    def player_data(self, wishlist, attendance, notes=''):
+        return {'player': {
+            'id': 100, 'name': 'Nesingtick', 'class': 'WR', 'rank': 20, 'role': 'D', 'notes': notes,
+            'wishlist': [{'item_id': item_id, 'prio': prio} for prio, item_id in enumerate(wishlist, 1)],
+            'attendance': attendance,
+        }}
+
+    def update_player(self, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/updatePlayer', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'][0]['wishlist'], data['player']['wishlist'])
+        return context
+
+    def test_update_player(self):
+        self.update_player(self.player_data([3, 2, 1], [1, 2, 3], notes='hi'))
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.notes, 'hi')
+        self.assertEqual(list(self.player.wishlist.values_list('item_id', 'priority')), [(3, 1), (2, 2), (1, 3)])
+        self.assertCountEqual(self.player.attendance.values_list('id', flat=True), [1, 2, 3])
+        self.assertEqual(self.player.last_attended_id, 3)
+
+        wishlist_ids = set(self.player.wishlist.values_list('id', flat=True))
+        self.update_player(self.player_data([3, 2, 4], [2, 3, 4], notes='hi'))
+        self.player.refresh_from_db()
+        self.assertEqual(list(self.player.wishlist.values_list('item_id', 'priority')), [(3, 1), (2, 2), (4, 3)])
+        self.assertEqual(len(wishlist_ids & set(self.player.wishlist.values_list('id', flat=True))), 2)
+        self.assertCountEqual(self.player.attendance.values_list('id', flat=True), [2, 3, 4])
+        self.assertEqual(self.player.last_attended_id, 4)
+
+    def test_repeated_wishlist_slot_is_rejected(self):
+        self.update_player(self.player_data([3, 2], []))
+        data = self.player_data([4, 5], [], notes='changed')
+        data['player']['wishlist'].append({'item_id': 1, 'prio': 1})
+        response = self.client.post('/api/updatePlayer', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('wishlist', response.data)
+        # Nothing from the rejected request is kept
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.notes, '')
+        self.assertEqual(list(self.player.wishlist.values_list('item_id', 'priority')), [(3, 1), (2, 2)])
+
+    def test_unchanged_update_only_reads(self):
+        data = self.player_data(range(1, 15), list(range(1, 31)))
+        self.update_player(data)
+        revision = revisions.current(Player)
+
+        context = self.update_player(data)
+        writes = [q['sql'] for q in context.captured_queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'django_session' not in q['sql']]
+        self.assertEqual(writes, [])
+        self.assertEqual(revisions.current(Player), revision)
+
+    def test_unchanged_update_returns_current_revision(self):
+        data = self.player_data([3, 2, 1], [1, 2, 3])
+        self.update_player(data)
+        # Someone else's write moves the player list past this player's own revision
+        with revisions.managed():
+            revision = revisions.bump(Player)
+
+        response = self.client.post('/api/updatePlayer', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['revision'], revision)
+
+
+class UpdateItemTests(LootTestCase):
+
+    def setUp(self):
+        setup_guild(players=(), raid_days=())
+        self.item = Item.objects.get(id=10)
+        for n in range(1, 6):
+            Player.objects.create(id=n, name=f"Player{n}")
+        self.admin = User.objects.get(username='nesingtick')
+        self.other = User.objects.create_user('morbidmind', password='test_password')
+        ClassPrio.objects.create(item=self.item, class_name="Hunters", prio=1, set_by=self.other)
+        super().setUp()
+
+    def item_data(self, class_prio, individual_prio, notes=''):
+        return {'item': {
+            'id': 10, 'tier': None, 'category': 'CS', 'notes': notes,
+            'class_prio': [{'class': class_name, 'prio': prio} for prio, class_name in enumerate(class_prio, 1)],
+            'individual_prio': [{'player_id': player_id, 'prio': prio}
+                                for prio, player_id in enumerate(individual_prio, 1)],
+        }}
+
+    def update_item(self, data, status=200):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/updateItem', data, format='json')
+        self.assertEqual(response.status_code, status)
+        return context, response
+
+    def test_update_item(self):
+        self.client.login(username='nesingtick', password='test_password')
+        self.update_item(self.item_data(['Hunters', 'Rogues'], [3, 1], notes='hi'))
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.notes, 'hi')
+        self.assertEqual(list(self.item.class_prios.values_list('class_name', 'prio', 'set_by')),
+                         [('Hunters', 1, self.other.id), ('Rogues', 2, self.admin.id)])
+        self.assertEqual(list(self.item.individual_prios.values_list('player_id', 'prio')), [(3, 1), (1, 2)])
+
+        _, response = self.update_item(self.item_data(['Rogues'], [3], notes='hi'))
+        self.assertEqual(response.data['rows'][0]['cprio_1'], 'Rogues')
+        self.assertEqual(response.data['rows'][0]['iprio_1'], 3)
+        self.assertEqual(list(self.item.class_prios.values_list('class_name', 'prio')), [('Rogues', 1)])
+        self.assertEqual(list(self.item.individual_prios.values_list('player_id', 'prio')), [(3, 1)])
+
+    def test_unchanged_update_only_reads(self):
+        self.client.login(username='nesingtick', password='test_password')
+        data = self.item_data(['Hunters', 'Rogues'], [1, 2, 3, 4, 5])
+        self.update_item(data)
+        revision = revisions.current(Item, ClassPrio, IndividualPrio)
+
+        context, _ = self.update_item(data)
+        writes = [q['sql'] for q in context.captured_queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'django_session' not in q['sql']]
+        self.assertEqual(writes, [])
+        self.assertEqual(revisions.current(Item, ClassPrio, IndividualPrio), revision)
+
+    def test_repeated_prio_slot_is_rejected(self):
+        self.client.login(username='nesingtick', password='test_password')
+        for data, field in [(self.item_data(['Hunters', 'Rogues'], [], notes='hi'), 'class_prio'),
+                            (self.item_data([], [1, 2], notes='hi'), 'individual_prio')]:
+            data['item'][field].append(data['item'][field][0])
+            _, response = self.update_item(data, status=400)
+            self.assertIn(field, response.data)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.notes, '')
+        self.assertEqual(list(self.item.class_prios.values_list('class_name', 'prio')), [('Hunters', 1)])
+        self.assertEqual(self.item.individual_prios.count(), 0)
+
+    def test_update_item_needs_permission(self):
+        self.client.login(username='morbidmind', password='test_password')
+        self.update_item(self.item_data([], []), status=403)
+        self.assertEqual(self.item.class_prios.count(), 1)
+
+
+class SQLiteTuningTests(APITestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connections_are_tuned(self):
+        # The test database is in memory, so journal_mode can't be WAL here
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), -32 * 1024)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    def test_pragmas_come_from_settings(self):
+        # Only PRAGMAs that can change inside the test's transaction
+        pragmas = {'cache_size': -2000, 'busy_timeout': 100}
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            tune_sqlite(sender=None, connection=connection)
+        self.assertEqual(self.pragma('cache_size'), -2000)
+        self.assertEqual(self.pragma('busy_timeout'), 100)
+
+        with override_settings(SQLITE_PRAGMAS={'cache_size': -32 * 1024, 'busy_timeout': 5000}):
+            tune_sqlite(sender=None, connection=connection)
+
+
+@override_settings(REQUEST_TIMING=True)
+class RequestTimingTests(LootTestCase):
+
+    def setUp(self):
+        setup_test_data()
+        super().setUp()
+
+    def server_timing(self, response):
+        # {'sql': {'dur': '1.2', 'desc': '"3 queries"'}, ...}
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/getPlayers/')
+        metrics = self.server_timing(response)
+        self.assertEqual(set(metrics), {'total', 'sql', 'serialize', 'render', 'size'})
+        self.assertEqual(metrics['sql']['desc'], f'"{len(context)} queries"')
+        self.assertEqual(metrics['size']['desc'], f'"{len(response.content)} bytes"')
+        self.assertGreater(float(metrics['serialize']['dur']), 0)
+
+    def test_compression_counts_once_as_render(self):
+        def slow_gzip(content):
+            time.sleep(0.05)
+            return gzip.compress(content)
+
+        with mock.patch.dict(cache.COMPRESSORS, gzip=slow_gzip), mock.patch.object(cache, 'MIN_COMPRESS_SIZE', 0):
+            response = self.client.get('/api/getPlayers/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        metrics = self.server_timing(response)
+        self.assertGreaterEqual(float(metrics['render']['dur']), 50)
+        self.assertLess(float(metrics['render']['dur']), float(metrics['total']['dur']))
+
+    def test_log_line(self):
+        with self.assertLogs('loot', 'INFO') as logs:
+            self.client.get('/api/getItems/')
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertIn('request method=GET path=/api/getItems/ view=item-list status=200 total_ms=', logs.output[0])
+        self.assertIn(' queries=', logs.output[0])
+        self.assertNotIn('over_budget', logs.output[0])
+
+    def test_over_budget(self):
+        budgets = {'total_ms': 10000, 'sql_ms': 10000, 'queries': 1, 'bytes': 10}
+        with override_settings(REQUEST_TIMING_BUDGETS=budgets), self.assertLogs('loot', 'WARNING') as logs:
+            response = self.client.get('/api/getItems/')
+        self.assertIn('over_budget=queries,bytes', logs.output[0])
+        self.assertEqual(self.server_timing(response)['budget']['desc'], '"over queries,bytes"')
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_off_by_default(self):
+        response = self.client.get('/api/getItems/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(LootTestCase):
+
+    def setUp(self):
+        setup_test_data()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(METRICS=True, METRICS_FILE=f'{directory.name}/metrics.sqlite3',
+                                      METRICS_FLUSH_SECONDS=3600)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics.reset()
+        # The last scrape records itself after flushing, which would otherwise go to the real METRICS_FILE at exit
+        self.addCleanup(metrics.reset)
+        super().setUp()
+
+    def scrape(self):
+        # {'name{labels}': value} for every sample
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                sample, value = line.rsplit(' ', 1)
+                samples[sample] = float(value)
+        return samples
+
+    def test_request_metrics(self):
+        self.client.get('/api/getItems/')
+        self.client.get('/api/getItems/')
+        samples = self.scrape()
+        self.assertEqual(samples['loot_requests_total{view="item-list",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['loot_request_duration_seconds_count{view="item-list"}'], 2)
+        self.assertEqual(samples['loot_request_duration_seconds_bucket{view="item-list",le="+Inf"}'], 2)
+        self.assertGreater(samples['loot_request_duration_seconds_sum{view="item-list"}'], 0)
+        self.assertEqual(samples['loot_request_queries_count{view="item-list"}'], 2)
+        self.assertEqual(samples['loot_response_cache_total{view="item-list",result="miss"}'], 1)
+        self.assertEqual(samples['loot_response_cache_total{view="item-list",result="hit"}'], 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.observe('loot_request_queries', 3, view='test')
+        metrics.observe('loot_request_queries', 30, view='test')
+        samples = self.scrape()
+        buckets = {le: samples[f'loot_request_queries_bucket{{view="test",le="{le}"}}']
+                   for le in metrics.QUERY_BUCKETS + ['+Inf']}
+        self.assertEqual(buckets, {1: 0, 2: 0, 5: 1, 10: 1, 25: 1, 50: 2, 100: 2, '+Inf': 2})
+        self.assertEqual(samples['loot_request_queries_sum{view="test"}'], 33)
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/getPlayers/')['ETag']
+        self.client.get('/api/getPlayers/', HTTP_IF_NONE_MATCH=etag)
+        samples = self.scrape()
+        self.assertEqual(samples['loot_response_cache_total{view="player-list",result="not_modified"}'], 1)
+        self.assertEqual(samples['loot_requests_total{view="player-list",method="GET",status="304"}'], 1)
+
+    def test_upload_rows(self):
+        self.client.force_authenticate(User.objects.create(username='officer', is_staff=True))
+        rows = [{'player': 'Nesingtick-Faerlina', 'itemID': 10, 'class': 'HUNTER', 'response': 'Mainspec'},
+                {'player': 'Newbie-Faerlina', 'itemID': 10, 'class': 'PRIEST', 'response': 'Offspec'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/uploadLootHistory', {'raid_day_id': 50, 'data': json.dumps(rows)},
+                                        format='json')
+        self.assertEqual(response.status_code, 204)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/uploadAttendance', {'raid_day_id': 50, 'data': 'Nesingtick-HUNTER,Ticksor-WARRIOR,'
+                                                                                  'Morbidmind-WARLOCK'}, format='json')
+        samples = self.scrape()
+        self.assertEqual(samples['loot_upload_rows_total{upload="loot_history"}'], 2)
+        self.assertEqual(samples['loot_upload_rows_total{upload="attendance"}'], 3)
+
+    def test_totals_across_workers(self):
+        def worker():
+            metrics.inc('loot_upload_rows_total', 5, upload='attendance')
+            metrics.flush(force=True)
+
+        metrics.inc('loot_upload_rows_total', 2, upload='attendance')
+        metrics.flush(force=True)
+        process = multiprocessing.get_context('fork').Process(target=worker)
+        process.start()
+        process.join()
+        metrics.inc('loot_upload_rows_total', 1, upload='attendance')
+        self.assertEqual(self.scrape()['loot_upload_rows_total{upload="attendance"}'], 8)
+
+    @override_settings(METRICS=False)
+    def test_off_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class ImporterTests(APITestCase):
+
+    def setUp(self):
+        self.raid = Raid.objects.create(id=1, name="Naxxramas", short_name="Naxx")
+        super().setUp()
+
+    def import_tier(self):
+        with Importer() as importer:
+            existing = importer.ids(Boss, 'name', 'raid_id')
+            importer.create(Boss, [Boss(name=name, raid=self.raid, order=1)
+                                   for name in ['Patchwerk', 'Thaddius'] if (name, 1) not in existing])
+            boss_ids = importer.ids(Boss, 'name', 'raid_id')
+            importer.create(Item, [Item(id=item_id, name=f'item {item_id}', type='t', raid=self.raid)
+                                   for item_id in (10, 11)])
+            ItemBoss = Item.bosses.through
+            importer.create(ItemBoss, [ItemBoss(item_id=10, boss_id=boss_ids['Patchwerk', 1]),
+                                       ItemBoss(item_id=11, boss_id=boss_ids['Thaddius', 1])])
+        return importer
+
+    def test_import(self):
+        resync = revisions.resync_revision()
+        importer = self.import_tier()
+        self.assertEqual(list(Item.objects.get(id=11).bosses.values_list('name', flat=True)), ['Thaddius'])
+        self.assertEqual(importer.stats['Item_bosses'][:2], [2, 2])
+        self.assertGreater(revisions.resync_revision(), resync)
+        self.assertIn('rows/s', importer.report())
+
+    def test_run_again_skips_existing_rows(self):
+        self.import_tier()
+        resync = revisions.resync_revision()
+        importer = self.import_tier()
+        self.assertEqual([new for _, new, _ in importer.stats.values()], [0, 0, 0])
+        self.assertEqual(Boss.objects.count(), 2)
+        self.assertEqual(revisions.resync_revision(), resync)
+
+    def test_rolls_back_on_error(self):
+        with self.assertRaises(KeyError):
+            with Importer() as importer:
+                importer.create(Item, [Item(id=10, name='item 10', type='t', raid=self.raid)])
+                importer.ids(Item, 'name')['item 11']
+        self.assertFalse(Item.objects.exists())
+
+
+class ValuesSerializerTests(APITestCase):
+
+    def setUp(self):
+        setup_test_data()
+        nes = Player.objects.get(id=100)
+        nes.alts.add(Player.objects.create(id=400, name="Nesalt", player_class=Player.Classes.MAGE))
+        nes.attendance.add(RaidDay.objects.create(id=55, name="BWL 2", date=date(2020, 2, 25), raid_id=1))
+        Wishlist.objects.create(player=nes, item_id=20, priority=2)
+        Wishlist.objects.create(player=nes, item_id=10, priority=1)
+        super().setUp()
+
+    def assertSameJSON(self, serializer_class, values_serializer_class, instances, context=None):
+        # Byte for byte, so field order and value formatting match too
+        context = context or {}
+        for many, data in [(True, instances), (False, instances[0])]:
+            expected = cache.json_renderer.render(serializer_class(data, many=many, context=context).data)
+            actual = cache.json_renderer.render(values_serializer_class(data, many=many, context=context).data)
+            self.assertEqual(actual, expected)
+
+    def test_players(self):
+        queryset = Player.objects.order_by('name')
+        self.assertSameJSON(PlayerSerializer, PlayerValuesSerializer, queryset)
+        self.assertSameJSON(PlayerSerializer, PlayerValuesSerializer, list(queryset))
+        raid_day_ids = list(RaidDay.objects.order_by('id').values_list('id', flat=True))
+        self.assertSameJSON(PlayerSerializer, PlayerValuesSerializer, queryset, {'raid_day_ids': raid_day_ids})
+
+    def test_raid_days(self):
+        self.assertSameJSON(RaidDaySerializer, RaidDayValuesSerializer, RaidDay.objects.all())
+        self.assertSameJSON(RaidDaySerializer, RaidDayValuesSerializer, list(RaidDay.objects.all()))
+
+    def test_loot_history(self):
+        queryset = LootHistory.objects.order_by('-raid_day_date', '-id')
+        self.assertSameJSON(LootHistorySerializer, LootHistoryValuesSerializer, queryset)
+        self.assertSameJSON(LootHistorySerializer, LootHistoryValuesSerializer, list(queryset))
+
+    def test_empty(self):
+        self.assertEqual(PlayerValuesSerializer(Player.objects.none(), many=True).data, [])
+
+
+class JSONTests(APITestCase):
+    data = {
+        'date': date(2021, 7, 5),
+        'utc': datetime(2021, 7, 5, 20, 30, 15, 250, tzinfo=timezone.utc),
+        'naive': datetime(2021, 7, 5, 20, 30),
+        'decimal': Decimal('1.5'),
+        'uuid': uuid.UUID(int=1),
+        'lazy': gettext_lazy('Loot'),
+        'text': "Ahn'Qiraj \u2028 Nelth's Tear \u2029 \u00e9",
+        'rows': [{'id': 1, 'prio': None, 'active': True}, (2, 3)],
+        10: 'int key',
+    }
+
+    def test_renderer_matches_drf(self):
+        expected = drf_renderers.JSONRenderer().render(self.data)
+        self.assertEqual(renderers.JSONRenderer().render(self.data), expected)
+        with mock.patch('loot.renderers.orjson', None):
+            self.assertEqual(renderers.JSONRenderer().render(self.data), expected)
+
+    def test_renderer_falls_back_to_drf(self):
+        data = {'big': 2 ** 70, 'rows': [1, 2]}
+        self.assertEqual(renderers.JSONRenderer().render(data), drf_renderers.JSONRenderer().render(data))
+
+    def test_renderer_indent(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(renderers.JSONRenderer().render(self.data, media_type),
+                         drf_renderers.JSONRenderer().render(self.data, media_type))
+
+    def test_parser(self):
+        body = '{"player": "Nésingtick", "rows": [1, 2.5, null]}'.encode()
+        for orjson in [renderers.orjson, None]:
+            with mock.patch('loot.parsers.orjson', orjson):
+                self.assertEqual(parsers.JSONParser().parse(io.BytesIO(body)),
+                                 {'player': 'Nésingtick', 'rows': [1, 2.5, None]})
+                self.assertEqual(parsers.loads('[{"itemID": 10}]'), [{'itemID': 10}])
+                for invalid in [b'{"player": ', b'[NaN]']:
+                    with self.assertRaises(ParseError):
+                        parsers.JSONParser().parse(io.BytesIO(invalid))
+
+    def test_bad_request_body(self):
+        user = User.objects.create(username='officer', is_staff=True)
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/uploadLootHistory', '{"raid_day_id": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BootstrapTests(LootTestCase):
+
+    def setUp(self):
+        setup_test_data()
+        super().setUp()
+
+    def test_matches_separate_endpoints(self):
+        self.client.force_authenticate(User.objects.get(username='nesingtick'))
+        data = self.client.get('/api/bootstrap').json()
+        self.assertEqual(list(data), ['revision', 'current_user', 'players', 'items', 'raids', 'raid_days',
+                                      'loot_history'])
+        self.assertEqual(data['revision'], revisions.current(*revisions.TRACKED_MODELS))
+        self.assertEqual(data['current_user'], self.client.get('/api/getCurrentUser').json())
+        self.assertEqual(data['current_user']['player']['name'], 'Nesingtick')
+        for name, path in [('players', '/api/getPlayers/'), ('items', '/api/getItems/'), ('raids', '/api/getRaids/'),
+                           ('raid_days', '/api/getRaidDays/'), ('loot_history', '/api/getLootHistory/')]:
+            self.assertEqual(data[name], self.client.get(path).json(), name)
+
+    def test_lists_are_cached_together(self):
+        self.client.get('/api/bootstrap')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/bootstrap')
+        self.assertEqual(response.json()['current_user'], {'player': None})
+        # Only the revision lookup, inside the snapshot's savepoint
+        self.assertEqual([query['sql'].split()[0] for query in context], ['SAVEPOINT', 'SELECT', 'RELEASE'])
+
+        revisions.bump(Item)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/bootstrap')
+        self.assertGreater(len(context), 1)
+        self.assertEqual(response.json()['revision'], revisions.current(Item))
+
+    def test_etag_is_per_user(self):
+        response = self.client.get('/api/bootstrap')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/bootstrap', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        user = User.objects.get(username='nesingtick')
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/bootstrap', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_user']['player']['permission_level'], 2)
+
+        # Permissions don't bump a revision, but still change the response
+        etag = response['ETag']
+        User.objects.filter(id=user.id).update(is_superuser=False)
+        self.client.force_authenticate(User.objects.get(id=user.id))
+        response = self.client.get('/api/bootstrap', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_user']['player']['permission_level'], 0)
+
+
+class CompressionTests(LootTestCase):
+
+    def setUp(self):
+        setup_test_data()
+        Player.objects.bulk_create([Player(name=f'Player{n}', name_key=f'player{n}') for n in range(50)])
+        super().setUp()
+
+    def test_gzip(self):
+        identity = self.client.get('/api/getPlayers/')
+        response = self.client.get('/api/getPlayers/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), identity.content)
+        self.assertLess(len(response.content), len(identity.content))
+
+        # Each representation has its own ETag
+        self.assertNotEqual(response['ETag'], identity['ETag'])
+        response = self.client.get('/api/getPlayers/', HTTP_ACCEPT_ENCODING='gzip, deflate',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_compressed_once_per_revision(self):
+        compress = mock.Mock(side_effect=cache.COMPRESSORS['gzip'])
+        with mock.patch.dict(cache.COMPRESSORS, {'gzip': compress}):
+            for _ in range(3):
+                self.client.get('/api/getPlayers/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(compress.call_count, 1)
+
+            revisions.bump(Player)
+            self.client.get('/api/getPlayers/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(compress.call_count, 2)
+
+    def test_negotiation(self):
+        with mock.patch.dict(cache.COMPRESSORS, {'br': lambda content: b'br' + content,
+                                                 'gzip': cache.COMPRESSORS['gzip']}, clear=True):
+            for accept_encoding, encoding in [('gzip, deflate, br', 'br'), ('gzip, br;q=0', 'gzip'),
+                                              ('*', 'br'), ('gzip;q=0, identity', None), ('', None)]:
+                response = self.client.get('/api/getPlayers/', HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(response.get('Content-Encoding'), encoding, accept_encoding)
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.client.get('/api/getRaids/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_bootstrap(self):
+        anonymous = self.client.get('/api/bootstrap', HTTP_ACCEPT_ENCODING='gzip')
+        self.client.force_authenticate(User.objects.get(username='nesingtick'))
+        identity = self.client.get('/api/bootstrap')
+        response = self.client.get('/api/bootstrap', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), identity.content)
+        self.assertNotEqual(gzip.decompress(anonymous.content), identity.content)
+
+
+class PrioSummaryTests(LootTestCase):
+
+    def setUp(self):
+        setup_test_data()
+        self.user = User.objects.get(username='nesingtick')
+        super().setUp()
+
+    def summary(self, item_id):
+        return Item.objects.values_list('iprio_1', 'iprio_2', 'cprio_1', 'cprio_2').get(id=item_id)
+
+    def test_prio_rows_update_summary(self):
+        self.assertEqual(self.summary(10), (100, None, 'Shaman', 'Paladin'))
+        self.assertEqual(self.summary(20), (None, None, 'Hunters', None))
+
+        IndividualPrio.objects.create(item_id=10, player_id=200, prio=2, set_by=self.user)
+        ClassPrio.objects.get(item_id=10, prio=1).delete()
+        self.assertEqual(self.summary(10), (100, 200, None, 'Paladin'))
+
+        # Deleting a player takes their prios with them
+        Player.objects.get(id=200).delete()
+        self.assertEqual(self.summary(10), (100, None, None, 'Paladin'))
+
+    def test_cascades_and_queryset_deletes(self):
+        ClassPrio.objects.filter(item_id=10, prio=2).delete()
+        self.assertEqual(self.summary(10), (100, None, 'Shaman', None))
+
+        # Takes every prio they set with them
+        self.user.delete()
+        self.assertEqual(self.summary(10), (None, None, None, None))
+        self.assertEqual(self.summary(20), (None, None, None, None))
+
+    def test_update_item(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/updateItem', {'item': {
+            'id': 10, 'tier': None, 'category': 'CS', 'notes': '',
+            'class_prio': [{'class': 'Paladin', 'prio': 1}, {'class': 'Shaman', 'prio': 2}],
+            'individual_prio': [{'player_id': 300, 'prio': 1}, {'player_id': 100, 'prio': 2}],
+        }}, format='json')
+        self.assertEqual(self.summary(10), (300, 100, 'Paladin', 'Shaman'))
+        self.assertEqual([response.data['rows'][0][field] for field in ['iprio_1', 'iprio_2', 'cprio_1', 'cprio_2']],
+                         [300, 100, 'Paladin', 'Shaman'])
+
+    def test_upload_loot_history_clears_looted_prios(self):
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        rows = [{'player': 'Nesingtick', 'itemID': 10, 'class': 'HUNTER', 'response': 'Mainspec'}]
+        response = self.client.post('/api/uploadLootHistory', {'raid_day_id': 50, 'data': json.dumps(rows)},
+                                    format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.summary(10), (None, None, 'Shaman', 'Paladin'))
+
+    def test_importer(self):
+        with Importer() as importer:
+            importer.create(IndividualPrio, [IndividualPrio(item_id=20, player_id=300, prio=1, set_by=self.user)])
+        self.assertEqual(self.summary(20), (300, None, 'Hunters', None))
+
+    def test_filter_and_order(self):
+        Item.objects.create(id=30, name="Zin'rokh", type="Weapon", category=Item.Categories.PHYSICAL, raid_id=1)
+        ClassPrio.objects.create(item_id=30, class_name="Hunters", prio=1, set_by=self.user)
+
+        response = self.client.get('/api/getItems/', {'cprio_1': 'Hunters'})
+        self.assertEqual([item['id'] for item in response.data], [30])
+        response = self.client.get('/api/getItems/', {'iprio_1': 100})
+        self.assertEqual([item['id'] for item in response.data], [10])
+        response = self.client.get('/api/getItems/', {'ordering': '-cprio_1'})
+        self.assertEqual([item['cprio_1'] for item in response.data], ['Shaman', 'Hunters'])
+
+        self.assertEqual(self.client.get('/api/getItems/', {'ordering': 'notes'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/getItems/', {'iprio_1': 'Nesingtick'}).status_code, 400)
+
+
+class RevisionReceiverTests(LootTestCase):
+
+    def setUp(self):
+        with revisions.managed():
+            setup_test_data()
+        super().setUp()
+
+    def revision_writes(self, context):
+        return [q['sql'] for q in context.captured_queries if q['sql'].startswith('UPDATE "loot_revision"')]
+
+    def test_cascade_delete_invalidates_cache(self):
+        since = self.client.get('/api/getLootHistory/?since=0').data['revision']
+        self.assertEqual(len(self.client.get('/api/getItems/').data[0]['class_prio']), 2)
+
+        # Takes the user's prios with it
+        User.objects.get(username='nesingtick').delete()
+        self.assertEqual(self.client.get('/api/getItems/').data[0]['class_prio'], [])
+        self.assertTrue(self.client.get(f'/api/getLootHistory/?since={since}').data['reset'])
+
+    def test_m2m_changes_invalidate_cache(self):
+        self.client.get('/api/getPlayers/')
+        Player.objects.get(id=200).attendance.add(50)
+        morb = next(player for player in self.client.get('/api/getPlayers/').data if player['id'] == 200)
+        self.assertEqual(morb['attendance'], [50])
+
+    def test_once_per_transaction(self):
+        with CaptureQueriesContext(connection) as context, transaction.atomic():
+            Player.objects.create(name='Newbie')
+            Player.objects.filter(id=100).first().save()
+            Wishlist.objects.filter(player_id=200).delete()
+        self.assertEqual(len(self.revision_writes(context)), 1)
+
+    def test_managed_writes_are_left_alone(self):
+        resync = revisions.resync_revision()
+        self.client.force_authenticate(User.objects.get(username='nesingtick'))
+        data = {'row': {'item_id': 10, 'player_id': 200, 'raid_day_id': 50}}
+        with CaptureQueriesContext(connection) as context:
+            self.client.post('/api/addLootHistory', data, format='json')
+        self.assertEqual(len(self.revision_writes(context)), 1)
+        self.assertEqual(revisions.resync_revision(), resync)
+
+
+class LastAttendedTests(APITestCase):
+
+    def setUp(self):
+        bwl = Raid.objects.create(id=1, name="Blackwing Lair", short_name="BWL")
+        self.days = {day: RaidDay.objects.create(id=day, name=f"BWL {day}", date=date(2020, 2, day), raid=bwl)
+                     for day in (1, 2, 3)}
+        self.player = Player.objects.create(id=100, name="Nesingtick", last_attended=self.days[3])
+        self.player.attendance.add(self.days[1], self.days[3])
+        super().setUp()
+
+    def test_deleting_raid_day(self):
+        self.days[3].delete()
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.last_attended_id, 1)
+        # Still inside the newest two raid days
+        with self.settings(INACTIVE_AFTER_RAID_DAYS=2):
+            update_inactive_players(revisions.bump(Player))
+        self.player.refresh_from_db()
+        self.assertTrue(self.player.is_active)
+
+        RaidDay.objects.filter(id=1).delete()
+        self.player.refresh_from_db()
+        self.assertIsNone(self.player.last_attended_id)
+
+    def test_moving_raid_day(self):
+        self.days[1].date = date(2020, 2, 10)
+        self.days[1].save()
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.last_attended_id, 1)
@@ -0,0 +1,129 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics as prometheus
+
+logger = logging.getLogger('loot')
+
+_timer = ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    # Running totals for one request, in seconds
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.spans = {'serialize': 0.0, 'render': 0.0}
+
+    def execute(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql += time.perf_counter() - start
+
+
+@contextmanager
+def measure(name):
+    # Adds the time spent in the block to the current request's span, less any SQL run inside it.
+    # Does nothing when timing is off.
+    timer = _timer.get()
+    if timer is None:
+        yield
+        return
+    start, sql_start = time.perf_counter(), timer.sql
+    try:
+        yield
+    finally:
+        timer.spans[name] += time.perf_counter() - start - (timer.sql - sql_start)
+
+
+def serialize(serializer):
+    # serializer.data, counted as serializer time
+    with measure('serialize'):
+        return serializer.data
+
+
+class RequestTimingMiddleware:
+    # Opt in with REQUEST_TIMING=True.  Sends a Server-Timing header with each response and logs it as one
+    # key=value line, at WARNING when the request goes over any of REQUEST_TIMING_BUDGETS.
+    # With METRICS=True the same measurements also feed the /metrics histograms (see metrics.py).
+
+    def __init__(self, get_response):
+        if not (settings.REQUEST_TIMING or settings.METRICS):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _timer.set(timer)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer.execute))
+                response = self.get_response(request)
+        finally:
+            _timer.reset(token)
+
+        metrics = {
+            'total_ms': (time.perf_counter() - start) * 1000,
+            'sql_ms': timer.sql * 1000,
+            'queries': timer.queries,
+            'serialize_ms': timer.spans['serialize'] * 1000,
+            'render_ms': timer.spans['render'] * 1000,
+            'bytes': 0 if response.streaming else len(response.content),
+        }
+        view = getattr(request.resolver_match, 'view_name', None)
+
+        if settings.METRICS:
+            label = view or 'unmatched'
+            prometheus.inc('loot_requests_total', view=label, method=request.method, status=response.status_code)
+            prometheus.observe('loot_request_duration_seconds', metrics['total_ms'] / 1000, view=label)
+            prometheus.observe('loot_request_queries', metrics['queries'], view=label)
+            prometheus.flush()
+
+        if settings.REQUEST_TIMING:
+            self.report(request, response, view, metrics)
+        return response
+
+    def report(self, request, response, view, metrics):
+        over_budget = [name for name, budget in settings.REQUEST_TIMING_BUDGETS.items() if metrics[name] > budget]
+
+        server_timing = [
+            f"total;dur={metrics['total_ms']:.1f}",
+            f"sql;dur={metrics['sql_ms']:.1f};desc=\"{metrics['queries']} queries\"",
+            f"serialize;dur={metrics['serialize_ms']:.1f}",
+            f"render;dur={metrics['render_ms']:.1f}",
+            f"size;desc=\"{metrics['bytes']} bytes\"",
+        ]
+        if over_budget:
+            server_timing.append(f"budget;desc=\"over {','.join(over_budget)}\"")
+        response['Server-Timing'] = ', '.join(server_timing)
+
+        fields = {'method': request.method, 'path': request.path, 'view': view, 'status': response.status_code}
+        fields.update({name: round(value, 1) for name, value in metrics.items()})
+        if over_budget:
+            fields['over_budget'] = ','.join(over_budget)
+        logger.log(logging.WARNING if over_budget else logging.INFO,
+                   'request ' + ' '.join(f'{name}={value}' for name, value in fields.items()))
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, so wrap render to time it
+        render = response.render
+
+        def timed_render():
+            with measure('render'):
+                return render()
+
+        response.render = timed_render
+        return response
@@ -1,19 +1,28 @@
-import json
 import logging
+import zlib
 from datetime import datetime
-from contextlib import suppress
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.utils.http import quote_etag
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from rest_framework import generics, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 
-from .serializers import (PlayerSerializer, ItemSerializer, RaidSerializer,
-                          RaidDaySerializer, LootHistorySerializer, CurrentUserSerializer)
-from .models import Player, Item, Raid, RaidDay, LootHistory, Wishlist, ClassPrio, IndividualPrio
+from .serializers import (PlayerValuesSerializer, ItemSerializer, RaidSerializer, RaidDayValuesSerializer,
+                          LootHistoryValuesSerializer, CurrentUserSerializer)
+from .models import (Player, Item, Raid, RaidDay, LootHistory, Wishlist, ClassPrio, IndividualPrio, Boss,
+                     normalize_name, update_prio_summaries)
 from .permissions import IsUserOrAdmin
+from .cache import CachedResponse, CachedViewSetMixin, json_renderer
+from .pagination import KeysetPagination
+from . import metrics, parsers, revisions, timing
 
 logger = logging.getLogger('loot')
 
@@ -27,44 +36,94 @@ class CsrfExemptSessionAuthentication(SessionAuthentication):
         return
 
 
-class PlayerViewSet(viewsets.ReadOnlyModelViewSet):
+class PlayerViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    revision_models = [Player, Wishlist, RaidDay]
+    delta_sync = True
+    # PlayerValuesSerializer reads wishlists, attendance and alts itself, one query each
     queryset = Player.objects.order_by('name')
-    serializer_class = PlayerSerializer
-
-
-class ItemViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Item.objects.filter(raid_id__lte=MAX_RAID_ID).order_by('name')
+    serializer_class = PlayerValuesSerializer
+    cache_query_params = ['attendance']
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # ?attendance=ranges sends attendance as [first, last] runs of raid days instead of every id
+        if self.request.query_params.get('attendance') == 'ranges':
+            context['raid_day_ids'] = list(RaidDay.objects.order_by('id').values_list('id', flat=True))
+        return context
+
+
+class ItemViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    revision_models = [Item, Boss, ClassPrio, IndividualPrio]
+    # Prefetch everything ItemSerializer touches so the query count doesn't grow with the item count
+    queryset = (Item.objects.filter(raid_id__lte=MAX_RAID_ID)
+                .order_by('name')
+                .prefetch_related('bosses', 'class_prios', 'individual_prios'))
     serializer_class = ItemSerializer
-
-
-class RaidViewSet(viewsets.ReadOnlyModelViewSet):
+    # iprio_1 ... cprio_2 are columns on Item, so these run in SQL
+    prio_fields = ['iprio_1', 'iprio_2', 'cprio_1', 'cprio_2']
+    cache_query_params = prio_fields + ['ordering']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?iprio_1=<player id>, ?cprio_1=<class> etc. keep the items where they hold that prio
+        filters = {field: self.request.query_params[field]
+                   for field in self.prio_fields if field in self.request.query_params}
+        for field in filters:
+            if field.startswith('iprio_') and not filters[field].isdigit():
+                raise ValidationError({field: 'Must be a player id'})
+        # ?ordering=cprio_1 (or -cprio_1) sorts by a prio, then by name
+        ordering = self.request.query_params.get('ordering')
+        if ordering is not None:
+            if ordering.lstrip('-') not in self.prio_fields:
+                raise ValidationError({'ordering': f"Must be one of {', '.join(self.prio_fields)}"})
+            queryset = queryset.order_by(ordering, 'name')
+        return queryset.filter(**filters)
+
+
+class RaidViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    revision_models = [Raid, Boss]
     queryset = Raid.objects.filter(id__lte=MAX_RAID_ID).order_by('-id')
     serializer_class = RaidSerializer
 
 
-class RaidDayViewSet(viewsets.ReadOnlyModelViewSet):
+class RaidDayViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    revision_models = [RaidDay]
     queryset = RaidDay.objects.filter(raid_id__lte=MAX_RAID_ID)
-    serializer_class = RaidDaySerializer
+    serializer_class = RaidDayValuesSerializer
 
 
-class LootHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+class LootHistoryViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    revision_models = [LootHistory, RaidDay]
+    delta_sync = True
     # Sort by date descending, then by id descending
-    queryset = LootHistory.objects.filter(raid_day__raid_id__lte=MAX_RAID_ID).order_by('-raid_day__date', '-id')
-    serializer_class = LootHistorySerializer
+    queryset = LootHistory.objects.filter(raid_day__raid_id__lte=MAX_RAID_ID).order_by('-raid_day_date', '-id')
+    serializer_class = LootHistoryValuesSerializer
+    pagination_class = KeysetPagination
+    cache_query_params = [KeysetPagination.page_size_query_param, KeysetPagination.cursor_query_param]
+
+
+def delta_response(revision, serializer=None, deleted=None):
+    # What the write views send back, in the same shape as a ?since= read, so clients can patch their
+    # copy of the list instead of fetching it again
+    rows = timing.serialize(serializer) if serializer is not None else []
+    return Response({'revision': revision, 'rows': rows, 'deleted': deleted or []})
 
 
 class SignupViewSet(generics.CreateAPIView):
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         if request.data['new']:
             player_name = request.data['player_name']
             try:
-                player = Player.objects.get(name__iexact=player_name)
+                player = Player.objects.get(name_key=normalize_name(player_name))
             except Player.DoesNotExist:
                 # Expected if player is truly new
                 player = Player.objects.create(name=player_name.capitalize(),
                                                player_class=request.data['class'],
-                                               role=request.data['role'])
+                                               role=request.data['role'],
+                                               revision=revisions.bump(Player))
         else:
             player = Player.objects.get(id=request.data['player_id'])
 
@@ -79,7 +138,7 @@ class SignupViewSet(generics.CreateAPIView):
         player.user = user
         player.save()
         login(request, user)
-        return Response(CurrentUserSerializer(user).data)
+        return Response(timing.serialize(CurrentUserSerializer(user)))
 
 
 class LoginViewSet(generics.CreateAPIView):
@@ -92,7 +151,7 @@ class LoginViewSet(generics.CreateAPIView):
 
         if user is not None:
             login(request, user)
-            return Response(CurrentUserSerializer(user).data)
+            return Response(timing.serialize(CurrentUserSerializer(user)))
         else:
             return Response({'error': 'Invalid Username or Password'})
 
@@ -104,19 +163,110 @@ class LogoutViewSet(generics.RetrieveAPIView):
         return Response(status=204)
 
 
+def current_user_data(user):
+    try:
+        return timing.serialize(CurrentUserSerializer(user))
+    except AttributeError:  # No User logged in
+        return {'player': None}
+
+
 class CurrentUserViewSet(generics.RetrieveAPIView):
 
     def get(self, request, *args, **kwargs):
-        try:
-            return Response(CurrentUserSerializer(request.user).data)
-        except AttributeError:  # No User logged in
-            return Response({'player': None})
+        return Response(current_user_data(request.user))
+
+
+class BootstrapViewSet(CachedViewSetMixin, generics.RetrieveAPIView):
+    # Everything the app loads on startup in one response: the revision, current_user and each of these lists,
+    # all read inside one transaction so they come from the same snapshot.  The lists are rendered and cached
+    # together per revision; only current_user is built per request.  The revision works as ?since= for any list.
+    lists = {
+        'players': PlayerViewSet,
+        'items': ItemViewSet,
+        'raids': RaidViewSet,
+        'raid_days': RaidDayViewSet,
+        'loot_history': LootHistoryViewSet,
+    }
+    revision_models = list(dict.fromkeys(model for viewset in lists.values() for model in viewset.revision_models))
+    cache_query_params = list(dict.fromkeys(param for viewset in lists.values()
+                                            for param in viewset.cache_query_params))
+
+    def get_etag(self, request, revision):
+        # current_user differs between users and can change without a revision (e.g. permissions)
+        user_hash = zlib.crc32(json_renderer.render(self.current_user))
+        return quote_etag(f"{revision}-{user_hash:x}-{self.get_representation(request)}")
+
+    def list_data(self, request, viewset):
+        view = viewset(request=request, format_kwarg=None, action='list', args=(), kwargs={})
+        return view.get_serializer(view.filter_queryset(view.get_queryset()), many=True).data
+
+    @transaction.atomic
+    def get(self, request, *args, **kwargs):
+        self.current_user = current_user_data(request.user)
+
+        def build_response(revision):
+            lists, content, compressed = self.cached_render(request, revision, lambda: {
+                name: self.list_data(request, viewset) for name, viewset in self.lists.items()
+            })
+            head = {'revision': revision, 'current_user': self.current_user}
+            # Splice the per-request head in front of the cached lists rather than rendering them again
+            with timing.measure('render'):
+                rendered_head = json_renderer.render(head)
+                content = rendered_head[:-1] + b',' + content[1:]
+            # Compressed copies depend on the head too, so they are kept per current_user (one per guild member
+            # at most, and dropped with the rest of the entry on the next revision)
+            return CachedResponse({**head, **lists}, content, compressed.setdefault(rendered_head, {}))
+
+        return self.conditional_response(request, build_response)
+
+
+class MetricsViewSet(generics.RetrieveAPIView):
+    # Prometheus scrape target, only there when METRICS is on
+
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS:
+            raise Http404
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def sync_rows(queryset, fields, keys, build, name='slots'):
+    # Makes the rows in queryset match keys, a list of tuples of the given fields, with one bulk delete
+    # and one bulk insert.  Rows that are already right are left alone.  Returns whether anything changed.
+    # The first field is the row's slot, which the model keeps unique; keys that repeat a slot are rejected
+    # with a ValidationError on name, before anything is written.
+    slots = {}
+    repeated = set()
+    for key in keys:
+        if key[0] in slots:
+            repeated.add(key[0])
+        slots[key[0]] = tuple(key)
+    if repeated:
+        raise ValidationError({name: f"Slots {sorted(repeated)} are given more than once"})
+    keys = set(slots.values())
+    existing = set()
+    stale_ids = []
+    for row_id, *key in queryset.values_list('id', *fields):
+        key = tuple(key)
+        if key in keys:
+            existing.add(key)
+        else:
+            stale_ids.append(row_id)
+
+    # Stale rows go first so the new ones can take over their slots
+    new_rows = [build(*key) for key in slots.values() if key not in existing]
+    if stale_ids:
+        queryset.model.objects.filter(id__in=stale_ids).delete()
+    if new_rows:
+        queryset.model.objects.bulk_create(new_rows)
+    return bool(stale_ids or new_rows)
 
 
 class UpdatePlayerViewSet(generics.CreateAPIView):
     permission_classes = [IsAuthenticated, IsUserOrAdmin]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"UpdatePlayer called by {request.user} with data {request.data}")
         player = Player.objects.get(id=request.data['player']['id'])
@@ -127,86 +277,104 @@ class UpdatePlayerViewSet(generics.CreateAPIView):
             logger.warning(f"UpdatePlayer cannot be called by {request.user}")
             raise
 
+        player_data = request.data['player']
+        new_values = {'notes': player_data['notes'], 'role': player_data['role']}
         # Only Superuser can update name/class/rank/attendance
         if request.user.is_superuser:
-            player.name = request.data['player']['name']
-            player.player_class = request.data['player']['class']
-            player.rank = request.data['player']['rank']
-            player.attendance.clear()
-            for raid_day_id in request.data['player']['attendance']:
-                player.attendance.add(RaidDay.objects.get(id=raid_day_id))
-
-        player.notes = request.data['player']['notes']
-        player.role = request.data['player']['role']
-
-        valid_ids = []
-        for wishlist_dict in request.data['player']['wishlist']:
-            w, _ = Wishlist.objects.get_or_create(
-                player=player,
-                item_id=wishlist_dict['item_id'],
-                priority=wishlist_dict['prio'],
-            )
-            valid_ids.append(w.id)
+            new_values.update(name=player_data['name'], player_class=player_data['class'], rank=player_data['rank'])
 
-        for wishlist in player.wishlist.exclude(id__in=valid_ids):
-            wishlist.delete()
+        # Only touch the DB for what actually changed
+        changed_models = []
+        if any(getattr(player, field) != value for field, value in new_values.items()):
+            changed_models.append(Player)
+            for field, value in new_values.items():
+                setattr(player, field, value)
 
-        player.save()
-        return Response(status=204)
+        if request.user.is_superuser:
+            attendance = set(player_data['attendance'])
+            current_attendance = set(player.attendance.values_list('id', flat=True))
+            if attendance != current_attendance:
+                player.attendance.remove(*(current_attendance - attendance))
+                player.attendance.add(*(attendance - current_attendance))
+                player.last_attended = player.attendance.first()
+                changed_models.append(Player)
+
+        if sync_rows(
+            player.wishlist.all(), ['priority', 'item_id'],
+            [(wishlist_dict['prio'], wishlist_dict['item_id']) for wishlist_dict in player_data['wishlist']],
+            lambda priority, item_id: Wishlist(player=player, item_id=item_id, priority=priority),
+            name='wishlist',
+        ):
+            changed_models += [Player, Wishlist]
+
+        if changed_models:
+            revision = player.revision = revisions.bump(*changed_models)
+            player.save()
+        else:
+            revision = revisions.current(*PlayerViewSet.revision_models)
+        return delta_response(revision, PlayerValuesSerializer([player], many=True))
 
 
 class UpdateItemViewSet(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"UpdateItem called by {request.user} with data {request.data}")
-        if not request.user.has_perm('loot.change_item'):
+        permissions = request.user.get_all_permissions()
+        if 'loot.change_item' not in permissions:
             logger.warning(f"UpdateItem cannot be called by {request.user}")
             raise PermissionDenied
 
-        item = Item.objects.get(id=request.data['item']['id'])
-
-        item.tier = request.data['item']['tier']
-        item.category = request.data['item']['category']
-        item.notes = request.data['item']['notes']
-
-        if request.user.has_perm('loot.change_classprio'):
-            valid_ids = []
-            for class_prio_dict in request.data['item']['class_prio']:
-                cp, _ = ClassPrio.objects.get_or_create(
-                    item=item,
-                    class_name=class_prio_dict['class'],
-                    prio=class_prio_dict['prio'],
-                    defaults={'set_by': request.user},
-                )
-                valid_ids.append(cp.id)
-
-            for class_prio in item.class_prios.exclude(id__in=valid_ids):
-                class_prio.delete()
-
-        if request.user.has_perm('loot.change_individualprio'):
-            valid_ids = []
-            for individual_prio_dict in request.data['item']['individual_prio']:
-                ip, _ = IndividualPrio.objects.get_or_create(
-                    item=item,
-                    player_id=individual_prio_dict['player_id'],
-                    prio=individual_prio_dict['prio'],
-                    defaults={'set_by': request.user},
-                )
-                valid_ids.append(ip.id)
-
-            for individual_prio in item.individual_prios.exclude(id__in=valid_ids):
-                individual_prio.delete()
-
-        item.save()
-        return Response(status=204)
+        item_data = request.data['item']
+        item = Item.objects.get(id=item_data['id'])
+
+        # Only touch the DB for what actually changed
+        changed_models = []
+        new_values = {'tier': item_data['tier'], 'category': item_data['category'], 'notes': item_data['notes']}
+        if any(getattr(item, field) != value for field, value in new_values.items()):
+            changed_models.append(Item)
+            for field, value in new_values.items():
+                setattr(item, field, value)
+            item.save()
+
+        if 'loot.change_classprio' in permissions and sync_rows(
+            item.class_prios.all(), ['prio', 'class_name'],
+            [(class_prio_dict['prio'], class_prio_dict['class']) for class_prio_dict in item_data['class_prio']],
+            lambda prio, class_name: ClassPrio(item=item, class_name=class_name, prio=prio, set_by=request.user),
+            name='class_prio',
+        ):
+            changed_models.append(ClassPrio)
+
+        if 'loot.change_individualprio' in permissions and sync_rows(
+            item.individual_prios.all(), ['prio', 'player_id'],
+            [(individual_prio_dict['prio'], individual_prio_dict['player_id'])
+             for individual_prio_dict in item_data['individual_prio']],
+            lambda prio, player_id: IndividualPrio(item=item, player_id=player_id, prio=prio, set_by=request.user),
+            name='individual_prio',
+        ):
+            changed_models.append(IndividualPrio)
+
+        # sync_rows inserts with bulk_create, which skips refresh_prio_summary
+        if ClassPrio in changed_models or IndividualPrio in changed_models:
+            update_prio_summaries([item.id])
+            item.refresh_from_db(fields=ItemViewSet.prio_fields)
+
+        if changed_models:
+            revision = revisions.bump(*changed_models)
+        else:
+            revision = revisions.current(*ItemViewSet.revision_models)
+        return delta_response(revision, ItemSerializer([item], many=True))
 
 
 class UpdateLootHistoryViewSet(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"UpdateLootHistory called by {request.user} with data {request.data}")
         if not request.user.has_perm('loot.change_loothistory'):
@@ -218,52 +386,204 @@ class UpdateLootHistoryViewSet(generics.CreateAPIView):
         loot_history.raid_day_id = request.data['row']['raid_day_id']
         loot_history.item_id = request.data['row']['item_id']
         loot_history.player_id = request.data['row']['player_id']
+        loot_history.revision = revisions.bump(LootHistory)
 
         loot_history.save()
-        return Response(status=204)
+        return delta_response(loot_history.revision, LootHistoryValuesSerializer([loot_history], many=True))
 
 
 class AddLootHistoryViewSet(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"AddLootHistory called by {request.user} with data {request.data}")
         if not request.user.has_perm('loot.add_loothistory'):
             logger.warning(f"AddLootHistory cannot be called by {request.user}")
             raise PermissionDenied
 
-        LootHistory.objects.create(
+        loot_history = LootHistory.objects.create(
             raid_day_id=request.data['row']['raid_day_id'],
             item_id=request.data['row']['item_id'],
             player_id=request.data['row']['player_id'],
+            revision=revisions.bump(LootHistory),
         )
 
-        return Response(status=204)
+        return delta_response(loot_history.revision, LootHistoryValuesSerializer([loot_history], many=True))
 
 
 class DeleteLootHistoryViewSet(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"DeleteLootHistory called by {request.user} with data {request.data}")
         if not request.user.has_perm('loot.delete_loothistory'):
             logger.warning(f"DeleteLootHistory cannot be called by {request.user}")
             raise PermissionDenied
 
-        with suppress(LootHistory.DoesNotExist):
+        try:
             LootHistory.objects.get(id=request.data['id']).delete()
+        except LootHistory.DoesNotExist:
+            return delta_response(revisions.current(*LootHistoryViewSet.revision_models))
+
+        revision = revisions.bump(LootHistory)
+        revisions.bury(LootHistory, [request.data['id']], revision)
+        return delta_response(revision, deleted=[request.data['id']])
+
+
+class BatchLootHistoryViewSet(generics.CreateAPIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
+
+    # Operation name -> permission it needs
+    OPERATIONS = {
+        'add': 'loot.add_loothistory',
+        'update': 'loot.change_loothistory',
+        'delete': 'loot.delete_loothistory',
+    }
+
+    # Fields each operation needs, so a malformed batch is a 400 before anything is looked up or written
+    FIELDS = ['raid_day_id', 'item_id', 'player_id']
+
+    def check_operations(self, operations):
+        if not isinstance(operations, list):
+            raise ValidationError({'operations': "A list of operations is required"})
+        unknown = {operation.get('op') if isinstance(operation, dict) else None for operation in operations}
+        unknown -= set(self.OPERATIONS)
+        if unknown:
+            raise ValidationError({'operations': f"Unknown operations {sorted(unknown, key=str)}"})
+        for n, operation in enumerate(operations):
+            if operation['op'] == 'delete':
+                required, row = ['id'], operation
+            else:
+                required = self.FIELDS + ['id'] if operation['op'] == 'update' else self.FIELDS
+                row = operation.get('row')
+                if not isinstance(row, dict):
+                    raise ValidationError({'operations': f"Operation {n} has no row"})
+            missing = [field for field in required if row.get(field) is None]
+            if missing:
+                raise ValidationError({'operations': f"Operation {n} is missing {missing}"})
+        return operations
+
+    @revisions.managed()
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        logger.info(f"BatchLootHistory called by {request.user} with data {request.data}")
+        operations = self.check_operations(request.data.get('operations'))
+        if not operations:
+            return delta_response(revisions.current(*LootHistoryViewSet.revision_models))
+
+        permissions = request.user.get_all_permissions()
+        if any(self.OPERATIONS[operation['op']] not in permissions for operation in operations):
+            logger.warning(f"BatchLootHistory cannot be called by {request.user}")
+            raise PermissionDenied
+
+        revision = revisions.bump(LootHistory)
+        fields = self.FIELDS
+
+        # Bulk writes skip LootHistory.save, so the raid day dates have to be filled in here
+        rows = [operation['row'] for operation in operations if operation['op'] in ('add', 'update')]
+        raid_day_dates = dict(RaidDay.objects.filter(id__in={row['raid_day_id'] for row in rows})
+                              .values_list('id', 'date'))
+        missing = {row['raid_day_id'] for row in rows} - set(raid_day_dates)
+        if missing:
+            raise ValidationError({'operations': f"Raid days {sorted(missing)} do not exist"})
+
+        updates = {operation['row']['id']: operation['row'] for operation in operations if operation['op'] == 'update'}
+        loot_history = LootHistory.objects.in_bulk(updates)
+        missing = set(updates) - set(loot_history)
+        if missing:
+            raise ValidationError({'operations': f"Loot history {sorted(missing)} does not exist"})
+        for row_id, row in updates.items():
+            for field in fields:
+                setattr(loot_history[row_id], field, row[field])
+            loot_history[row_id].raid_day_date = raid_day_dates[row['raid_day_id']]
+            loot_history[row_id].revision = revision
+        LootHistory.objects.bulk_update(loot_history.values(), fields + ['raid_day_date', 'revision'])
+
+        LootHistory.objects.bulk_create([
+            LootHistory(revision=revision, raid_day_date=raid_day_dates[operation['row']['raid_day_id']],
+                        **{field: operation['row'][field] for field in fields})
+            for operation in operations if operation['op'] == 'add'
+        ])
+
+        deleted_ids = [operation['id'] for operation in operations if operation['op'] == 'delete']
+        deleted = LootHistory.objects.filter(id__in=deleted_ids)
+        deleted_ids = list(deleted.values_list('id', flat=True))
+        deleted.delete()
+        revisions.bury(LootHistory, deleted_ids, revision)
+
+        # Everything added or updated here, and nothing else, carries this revision
+        changed = LootHistory.objects.filter(revision=revision)
+        return delta_response(revision, LootHistoryValuesSerializer(changed, many=True), deleted_ids)
+
+
+def resolve_players(player_classes, revision):
+    # Takes {normalized name: class from the addon} and returns {normalized name: player id}.
+    # Existing players are found in one query, and missing ones are created in one bulk insert.
+    names = list(player_classes)
+    player_ids = dict(Player.objects.filter(name_key__in=names).values_list('name_key', 'id'))
+
+    new_players = [
+        Player(name=name.capitalize(), name_key=name, player_class=Player.Classes[player_classes[name].upper()],
+               revision=revision)
+        for name in names if name not in player_ids
+    ]
+    if new_players:
+        Player.objects.bulk_create(new_players)
+        new_names = [player.name_key for player in new_players]
+        player_ids.update(Player.objects.filter(name_key__in=new_names).values_list('name_key', 'id'))
+
+    return player_ids
+
+
+def delete_player_item_pairs(model, pairs):
+    # Deletes every row of model matching one of the (player_id, item_id) pairs, in two queries total
+    if not pairs:
+        return
+    candidates = model.objects.filter(player_id__in={player_id for player_id, _ in pairs},
+                                      item_id__in={item_id for _, item_id in pairs})
+    ids = [row_id for row_id, player_id, item_id in candidates.values_list('id', 'player_id', 'item_id')
+           if (player_id, item_id) in pairs]
+    model.objects.filter(id__in=ids).delete()
+
+
+def newer_than(raid_day, prefix=''):
+    # Matches raid days that sort before raid_day in the default -date, -id ordering
+    return (Q(**{f'{prefix}date__gt': raid_day.date})
+            | Q(**{f'{prefix}date': raid_day.date, f'{prefix}id__gt': raid_day.id}))
 
-        return Response(status=204)
+
+def update_inactive_players(revision):
+    # Marks players inactive if they have not attended any of the newest INACTIVE_AFTER_RAID_DAYS raid days.
+    # Only reads last_attended, and only touches the players whose is_active actually changes.
+    window_start = RaidDay.objects.all()[settings.INACTIVE_AFTER_RAID_DAYS - 1:].first()
+    if window_start is None:
+        in_window = ~Q(last_attended=None)
+    else:
+        in_window = newer_than(window_start, 'last_attended__') | Q(last_attended=window_start)
+
+    Player.objects.filter(is_active=True).exclude(in_window).update(is_active=False, revision=revision)
 
 
 class UploadAttendanceViewSet(generics.CreateAPIView):
     permission_classes = [IsAdminUser]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"UploadAttendance called by {request.user} with data {request.data}")
+        changed_models = [Player]
+        if request.data['raid_day_id'] == 'New':
+            changed_models.append(RaidDay)
+        revision = revisions.bump(*changed_models)
+
         if request.data['raid_day_id'] == 'New':
             raid_day = RaidDay.objects.create(
                 name=request.data['raid_day_name'],
@@ -273,22 +593,37 @@ class UploadAttendanceViewSet(generics.CreateAPIView):
         else:
             raid_day = RaidDay.objects.get(id=request.data['raid_day_id'])
 
-        player_names = request.data['data'].split(',')
-
-        for name_class in player_names:
-            player_name, player_class = name_class.split('-', 2)
-            try:
-                player = Player.objects.get(name__iexact=player_name)
-            except Player.DoesNotExist:
-                player_class = Player.Classes[player_class.upper()]
-                player = Player.objects.create(name=player_name.capitalize(), player_class=player_class)
-
-            player.attendance.add(raid_day)
-            player.is_active = True
-            player.save()
+        # data is one addon export string, or several (one per boss) as a list or on separate lines
+        snapshots = request.data['data']
+        if isinstance(snapshots, str):
+            snapshots = snapshots.splitlines()
+
+        player_classes = {}
+        for snapshot in snapshots:
+            for name_class in filter(None, snapshot.strip().split(',')):
+                player_name, player_class = name_class.split('-', 2)
+                player_classes[normalize_name(player_name)] = player_class
+        transaction.on_commit(lambda: metrics.inc('loot_upload_rows_total', len(player_classes), upload='attendance'))
+
+        player_ids = resolve_players(player_classes, revision)
+
+        # Only players whose attendance, last_attended or is_active changes get the new revision, so uploading
+        # the same roster again doesn't send every attendee back down in the next delta
+        Attendance = Player.attendance.through
+        attended = set(Attendance.objects.filter(raidday_id=raid_day.id, player_id__in=player_ids.values())
+                       .values_list('player_id', flat=True))
+        new_attendees = [player_id for player_id in player_ids.values() if player_id not in attended]
+        Attendance.objects.bulk_create(
+            [Attendance(player_id=player_id, raidday_id=raid_day.id) for player_id in new_attendees],
+            ignore_conflicts=True,
+        )
+        Player.objects.filter(id__in=new_attendees).update(revision=revision)
+        attendees = Player.objects.filter(id__in=player_ids.values())
+        attendees.exclude(newer_than(raid_day, 'last_attended__') | Q(last_attended=raid_day)).update(
+            last_attended=raid_day, revision=revision)
+        attendees.filter(is_active=False).update(is_active=True, revision=revision)
 
-        # Mark players inactive if they have not attended any of the past 8 raids
-        Player.objects.exclude(attendance__in=RaidDay.objects.all()[:8]).distinct().update(is_active=False)
+        update_inactive_players(revision)
 
         return Response(status=204)
 
@@ -297,8 +632,15 @@ class UploadLootHistoryViewSet(generics.CreateAPIView):
     permission_classes = [IsAdminUser]
     authentication_classes = [CsrfExemptSessionAuthentication, BasicAuthentication]
 
+    @revisions.managed()
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         logger.info(f"UploadLootHistory called by {request.user} with data {request.data}")
+        changed_models = [Player, LootHistory, Wishlist, IndividualPrio]
+        if request.data['raid_day_id'] == 'New':
+            changed_models.append(RaidDay)
+        revision = revisions.bump(*changed_models)
+
         if request.data['raid_day_id'] == 'New':
             raid_day = RaidDay.objects.create(
                 name=request.data['raid_day_name'],
@@ -308,37 +650,35 @@ class UploadLootHistoryViewSet(generics.CreateAPIView):
         else:
             raid_day = RaidDay.objects.get(id=request.data['raid_day_id'])
 
-        json_data = json.loads(request.data['data'])
-        for loot_history_data in json_data:
-            # Strip server name
-            player_name = loot_history_data['player'].split('-')[0]
-            item_id = loot_history_data['itemID']
-            is_disenchant = loot_history_data['response'] == 'Disenchant'
-
-            if not is_disenchant:
-                try:
-                    player = Player.objects.get(name__iexact=player_name)
-                except Player.DoesNotExist:
-                    player_class = Player.Classes[loot_history_data['class'].upper()]
-                    player = Player.objects.create(name=player_name.capitalize(), player_class=player_class)
+        # Disenchants don't go to a player, so they aren't recorded
+        json_data = [row for row in parsers.loads(request.data['data']) if row['response'] != 'Disenchant']
 
-                player.is_active = True
-                player.save()
+        items = Item.objects.in_bulk({int(row['itemID']) for row in json_data})
+        # Reject the whole upload, so the officer can add the missing items and send it again
+        unknown = {int(row['itemID']) for row in json_data} - set(items)
+        if unknown:
+            logger.warning(f"UploadLootHistory rejected, unknown items {sorted(unknown)}")
+            raise ValidationError({'data': f"Unknown items {sorted(unknown)}"})
 
-                item = Item.objects.get(id=item_id)
+        player_classes = {normalize_name(row['player']): row['class'] for row in json_data}
+        player_ids = resolve_players(player_classes, revision)
 
-                if item.raid == raid_day.raid:
+        loot_history = []
+        for row in json_data:
+            player_id = player_ids[normalize_name(row['player'])]
+            item = items[int(row['itemID'])]
+            if item.raid_id == raid_day.raid_id:
+                loot_history.append(LootHistory(raid_day=raid_day, raid_day_date=raid_day.date, item=item,
+                                                player_id=player_id, revision=revision))
 
-                    LootHistory.objects.create(
-                        raid_day=raid_day,
-                        item=item,
-                        player=player,
-                    )
+        LootHistory.objects.bulk_create(loot_history)
+        transaction.on_commit(lambda: metrics.inc('loot_upload_rows_total', len(loot_history), upload='loot_history'))
 
-                    with suppress(Wishlist.DoesNotExist):
-                        Wishlist.objects.get(player=player, item=item).delete()
+        looted = {(lh.player_id, lh.item_id) for lh in loot_history}
+        delete_player_item_pairs(Wishlist, looted)
+        # Item's prio summaries follow through refresh_prio_summary
+        delete_player_item_pairs(IndividualPrio, looted)
 
-                    with suppress(IndividualPrio.DoesNotExist):
-                        IndividualPrio.objects.get(player=player, item=item).delete()
+        Player.objects.filter(id__in=player_ids.values()).update(is_active=True, revision=revision)
 
         return Response(status=204)
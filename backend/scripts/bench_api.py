@@ -0,0 +1,348 @@
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework.test import APIClient
+
+from loot import cache, revisions, urls
+from loot.models import (Player, Wishlist, Item, ClassPrio, IndividualPrio, Raid, Boss, RaidDay, LootHistory,
+                         normalize_name, update_prio_summaries)
+
+# Times every route in loot/urls.py against a synthetic guild, cold (response cache cleared, fresh DB connection)
+# and warm (repeated straight away), with query counts, and writes the results as JSON so runs on different
+# commits can be compared.  Runs against a throwaway database file.
+# python manage.py runscript bench_api --script-args players=150 loot_rows=5000 out=bench_api.json
+# python manage.py runscript bench_api --script-args out=after.json compare=before.json
+
+GUILD_DEFAULTS = {
+    'players': 150,
+    'raids': 3,
+    'items_per_raid': 60,
+    'raid_days': 120,
+    'attendees': 25,
+    'wishlist': 10,
+    'loot_rows': 5000,
+}
+BENCH_PASSWORD = 'bench_password'
+
+
+def build_guild(players, raids, items_per_raid, raid_days, attendees, wishlist, loot_rows, seed=0):
+    # Everything is bulk inserted, so a large guild takes seconds rather than minutes to build
+    rng = random.Random(seed)
+    Raid.objects.bulk_create([Raid(id=raid, name=f'Raid {raid}', short_name=f'R{raid}')
+                              for raid in range(1, raids + 1)])
+    Boss.objects.bulk_create([Boss(id=raid * 10 + order, name=f'Boss {raid}-{order}', raid_id=raid, order=order)
+                              for raid in range(1, raids + 1) for order in range(1, 6)])
+
+    items_by_raid = {raid: list(range((raid - 1) * items_per_raid + 1, raid * items_per_raid + 1))
+                     for raid in range(1, raids + 1)}
+    Item.objects.bulk_create([
+        Item(id=item, name=f'Item {item}', type='Trinket', category=rng.choice(Item.Categories.values), raid_id=raid)
+        for raid, items in items_by_raid.items() for item in items
+    ])
+    Item.bosses.through.objects.bulk_create([
+        Item.bosses.through(item_id=item, boss_id=raid * 10 + rng.randint(1, 5))
+        for raid, items in items_by_raid.items() for item in items
+    ])
+
+    player_ids = list(range(1, players + 1))
+    Player.objects.bulk_create([
+        Player(id=player, name=f'Player{player}', name_key=normalize_name(f'Player{player}'),
+               player_class=rng.choice(Player.Classes.values), role=rng.choice(Player.Roles.values),
+               rank=rng.choice(Player.Ranks.values))
+        for player in player_ids
+    ])
+    Player.alts.through.objects.bulk_create(
+        [Player.alts.through(from_player_id=player, to_player_id=player - 1) for player in player_ids[1::5]]
+        + [Player.alts.through(from_player_id=player - 1, to_player_id=player) for player in player_ids[1::5]]
+    )
+
+    days = [RaidDay(id=day, name=f'Raid {day % raids + 1} #{day}', date=date(2021, 1, 1) + timedelta(days=day * 3),
+                    raid_id=day % raids + 1)
+            for day in range(1, raid_days + 1)]
+    RaidDay.objects.bulk_create(days)
+    attendance = {day.id: rng.sample(player_ids, min(attendees, players)) for day in days}
+    Player.attendance.through.objects.bulk_create([
+        Player.attendance.through(player_id=player, raidday_id=day) for day, present in attendance.items()
+        for player in present
+    ], batch_size=5000)
+    # Days are created oldest first, so the last one seen is each player's newest
+    last_attended = {player: day for day, present in attendance.items() for player in present}
+    Player.objects.bulk_update(
+        [Player(id=player, last_attended_id=last_attended.get(player), is_active=player in last_attended)
+         for player in player_ids],
+        ['last_attended', 'is_active'], batch_size=500,
+    )
+
+    current_items = items_by_raid[1]
+    Wishlist.objects.bulk_create([
+        Wishlist(player_id=player, item_id=item, priority=slot)
+        for player in player_ids
+        for slot, item in enumerate(rng.sample(current_items, min(wishlist, len(current_items))), 1)
+    ], batch_size=5000)
+
+    user = User.objects.create_user('bench', password=BENCH_PASSWORD, is_superuser=True, is_staff=True)
+    Player.objects.filter(id=1).update(user=user)
+    ClassPrio.objects.bulk_create([
+        ClassPrio(item_id=item, class_name=class_name, prio=slot, set_by=user)
+        for items in items_by_raid.values() for item in items
+        for slot, class_name in enumerate(rng.sample(Player.Classes.labels, 2), 1)
+    ])
+    IndividualPrio.objects.bulk_create([
+        IndividualPrio(item_id=item, player_id=rng.choice(player_ids), prio=1, set_by=user)
+        for items in items_by_raid.values() for item in items[::3]
+    ])
+    update_prio_summaries()
+
+    loot = []
+    for _ in range(loot_rows):
+        day = rng.choice(days)
+        loot.append(LootHistory(raid_day_id=day.id, raid_day_date=day.date, player_id=rng.choice(player_ids),
+                                item_id=rng.choice(items_by_raid[day.raid_id])))
+    LootHistory.objects.bulk_create(loot, batch_size=5000)
+
+    revisions.bump(*revisions.TRACKED_MODELS)
+
+    # Then one raid night on top, stamped with the next revision, so the ?since= routes send a realistic delta
+    # (the newest raid day's attendees and loot, and a few deleted rows) rather than an empty one
+    with revisions.managed():
+        revision = revisions.bump(Player, LootHistory)
+        newest = days[-1]
+        Player.objects.filter(id__in=attendance[newest.id]).update(revision=revision)
+        LootHistory.objects.filter(raid_day_id=newest.id).update(revision=revision)
+        deleted = list(LootHistory.objects.filter(raid_day_id=days[-2].id).values_list('id', flat=True)[:5])
+        LootHistory.objects.filter(id__in=deleted).delete()
+        revisions.bury(LootHistory, deleted, revision)
+    return user
+
+
+class Routes:
+    # The requests to time.  Each has a URL name from loot/urls.py, a client and a request builder that is called
+    # untimed before every run, so writes always have fresh data to work with.
+
+    def __init__(self, user):
+        self.user = user
+        self.admin = APIClient()
+        self.admin.login(username='bench', password=BENCH_PASSWORD)
+        self.anonymous = APIClient()
+        self.run = 0
+
+        self.player = Player.objects.get(id=1)
+        self.player_count = Player.objects.count()
+        self.item = Item.objects.filter(raid_id=1).first()
+        self.raid_day = RaidDay.objects.filter(raid_id=1).first()
+        self.current_items = list(Item.objects.filter(raid_id=1).values_list('id', flat=True))
+        self.loot_id = LootHistory.objects.filter(raid_day__raid_id=1).values_list('id', flat=True).first()
+        # Rows for the delete routes, taken from the oldest end so the other routes don't notice
+        self.deletable = list(LootHistory.objects.order_by('raid_day_date', 'id').values_list('id', flat=True)[:500])
+        # A delta from just before build_guild's last raid night, which is the only revision after it
+        self.since = revisions.current(*revisions.TRACKED_MODELS) - 1
+
+    def all(self):
+        since = self.since
+        return [
+            ('api-root', self.admin, 'get', lambda: (reverse('api-root'), None)),
+            ('player-list', self.admin, 'get', lambda: (reverse('player-list'), None)),
+            ('player-list', self.admin, 'get', lambda: (reverse('player-list') + '?attendance=ranges', None)),
+            ('player-list', self.admin, 'get', lambda: (reverse('player-list') + f'?since={since}', None)),
+            ('player-detail', self.admin, 'get', lambda: (reverse('player-detail', args=[1]), None)),
+            ('item-list', self.admin, 'get', lambda: (reverse('item-list'), None)),
+            ('item-detail', self.admin, 'get', lambda: (reverse('item-detail', args=[self.item.id]), None)),
+            ('raid-list', self.admin, 'get', lambda: (reverse('raid-list'), None)),
+            ('raid-detail', self.admin, 'get', lambda: (reverse('raid-detail', args=[1]), None)),
+            ('raidday-list', self.admin, 'get', lambda: (reverse('raidday-list'), None)),
+            ('raidday-detail', self.admin, 'get', lambda: (reverse('raidday-detail', args=[self.raid_day.id]), None)),
+            ('loothistory-list', self.admin, 'get', lambda: (reverse('loothistory-list'), None)),
+            ('loothistory-list', self.admin, 'get', lambda: (reverse('loothistory-list') + '?page_size=100', None)),
+            ('loothistory-list', self.admin, 'get', lambda: (reverse('loothistory-list') + f'?since={since}', None)),
+            ('loothistory-detail', self.admin, 'get',
+             lambda: (reverse('loothistory-detail', args=[self.loot_id]), None)),
+            ('current_user', self.admin, 'get', lambda: (reverse('current_user'), None)),
+            ('bootstrap', self.admin, 'get', lambda: (reverse('bootstrap'), None)),
+            ('update_player', self.admin, 'post', self.update_player),
+            ('update_item', self.admin, 'post', self.update_item),
+            ('add_loot_history', self.admin, 'post', lambda: (reverse('add_loot_history'), {'row': self.loot_row()})),
+            ('update_loot_history', self.admin, 'post', lambda: (
+                reverse('update_loot_history'), {'row': dict(self.loot_row(), id=self.loot_id)})),
+            ('delete_loot_history', self.admin, 'post', lambda: (
+                reverse('delete_loot_history'), {'id': self.deletable.pop()})),
+            ('batch_loot_history', self.admin, 'post', self.batch_loot_history),
+            ('upload_attendance', self.admin, 'post', self.upload_attendance),
+            ('upload_loot_history', self.admin, 'post', self.upload_loot_history),
+            ('signup', self.anonymous, 'post', self.signup),
+            ('login', self.anonymous, 'post', lambda: (
+                reverse('login'), {'player_name': 'bench', 'password': BENCH_PASSWORD})),
+            ('logout', self.anonymous, 'get', self.logout),
+        ]
+
+    def next_run(self):
+        self.run += 1
+        return self.run
+
+    def loot_row(self):
+        run = self.next_run()
+        return {'item_id': self.current_items[run % len(self.current_items)], 'player_id': run % self.player_count + 1,
+                'raid_day_id': self.raid_day.id}
+
+    def update_player(self):
+        player = self.player
+        return reverse('update_player'), {'player': {
+            'id': player.id, 'name': player.name, 'class': player.player_class, 'rank': player.rank,
+            'role': player.role, 'notes': f'bench {self.next_run()}',
+            'wishlist': [{'item_id': item_id, 'prio': prio}
+                         for item_id, prio in player.wishlist.values_list('item_id', 'priority')],
+            'attendance': list(player.attendance.values_list('id', flat=True)),
+        }}
+
+    def update_item(self):
+        item = self.item
+        return reverse('update_item'), {'item': {
+            'id': item.id, 'tier': item.tier, 'category': item.category, 'notes': f'bench {self.next_run()}',
+            'class_prio': [{'class': class_name, 'prio': prio}
+                           for class_name, prio in item.class_prios.values_list('class_name', 'prio')],
+            'individual_prio': [{'player_id': player_id, 'prio': prio}
+                                for player_id, prio in item.individual_prios.values_list('player_id', 'prio')],
+        }}
+
+    def batch_loot_history(self):
+        operations = [{'op': 'add', 'row': self.loot_row()} for _ in range(10)]
+        operations += [{'op': 'update', 'row': dict(self.loot_row(), id=self.loot_id)}]
+        operations += [{'op': 'delete', 'id': self.deletable.pop()} for _ in range(5)]
+        return reverse('batch_loot_history'), {'operations': operations}
+
+    def upload_attendance(self):
+        run = self.next_run()
+        roster = ','.join(f'Player{(run + n) % self.player_count + 1}-MAGE' for n in range(25))
+        return reverse('upload_attendance'), {
+            'raid_day_id': 'New', 'raid_day_name': f'Bench {run}', 'raid_id': 1,
+            'date': (date(2030, 1, 1) + timedelta(days=run)).isoformat(), 'data': roster,
+        }
+
+    def upload_loot_history(self):
+        run = self.next_run()
+        rows = [{'player': f'Player{(run + n) % self.player_count + 1}-Faerlina', 'itemID': self.current_items[n % 20],
+                 'class': 'MAGE', 'response': 'Mainspec'} for n in range(25)]
+        return reverse('upload_loot_history'), {'raid_day_id': self.raid_day.id, 'data': json.dumps(rows)}
+
+    def signup(self):
+        return reverse('signup'), {'new': True, 'player_name': f'Signup{self.next_run()}', 'class': 'PR',
+                                   'role': 'H', 'password': BENCH_PASSWORD}
+
+    def logout(self):
+        self.anonymous.force_login(self.user)
+        return reverse('logout'), None
+
+
+def url_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def time_request(client, method, build, cold):
+    path, data = build()
+    if cold:
+        cache.clear()
+        connections.close_all()
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        response = getattr(client, method)(path, data, format='json')
+        elapsed = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method.upper()} {path} returned {response.status_code}')
+    return elapsed * 1000, len(context), len(response.content)
+
+
+def bench(routes, repeat):
+    results = {}
+    for name, client, method, build in routes.all():
+        path, _ = build()
+        # The revision number depends on the migrations, so keep it out of the label runs are compared by
+        label = f'{method.upper()} {path}'.replace(f'since={routes.since}', 'since=<latest-1>')
+        runs = {'cold': [], 'warm': []}
+        for _ in range(repeat):
+            for kind in runs:
+                runs[kind].append(time_request(client, method, build, cold=kind == 'cold'))
+        results[label] = {'url_name': name}
+        for kind, timings in runs.items():
+            results[label][f'{kind}_ms'] = round(statistics.median(ms for ms, _, _ in timings), 2)
+            results[label][f'{kind}_queries'] = timings[-1][1]
+        results[label]['bytes'] = runs['cold'][-1][2]
+    return results
+
+
+def compare(results, previous):
+    print(f"\n{'route':<50} {'cold ms':>17} {'warm ms':>17} {'queries':>9}")
+    for label, result in results.items():
+        old = previous['routes'].get(label)
+        if old is None:
+            continue
+        print(f"{label:<50} {old['cold_ms']:>7.1f} -> {result['cold_ms']:>6.1f} "
+              f"{old['warm_ms']:>7.1f} -> {result['warm_ms']:>6.1f} "
+              f"{old['cold_queries']:>3} -> {result['cold_queries']:<3}")
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(*args):
+    options = dict(arg.split('=', 1) for arg in args)
+    guild = {key: int(options.get(key, default)) for key, default in GUILD_DEFAULTS.items()}
+    repeat = int(options.get('repeat', 5))
+    out = Path(options.get('out', 'bench_api.json'))
+    setup_test_environment()
+
+    with tempfile.TemporaryDirectory() as directory:
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST']['NAME'] = str(Path(directory) / 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            start = time.perf_counter()
+            user = build_guild(**guild)
+            print(f'Built guild {guild} in {time.perf_counter() - start:.1f}s')
+
+            routes = Routes(user)
+            covered = {name for name, *_ in routes.all()}
+            missing = sorted(set(url_names(urls.urlpatterns)) - covered)
+            if missing:
+                print(f"Not benchmarked: {', '.join(missing)}")
+
+            results = bench(routes, repeat)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f"\n{'route':<50} {'cold ms':>9} {'warm ms':>9} {'queries':>9} {'bytes':>9}")
+    for label, result in results.items():
+        print(f"{label:<50} {result['cold_ms']:>9.1f} {result['warm_ms']:>9.1f} "
+              f"{result['cold_queries']:>4}/{result['warm_queries']:<4} {result['bytes']:>9}")
+
+    out.write_text(json.dumps({
+        'commit': commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'guild': guild,
+        'repeat': repeat,
+        'routes': results,
+    }, indent=2))
+    print(f'\nWrote {out}')
+
+    if 'compare' in options:
+        compare(results, json.loads(Path(options['compare']).read_text()))
+    sys.stdout.flush()
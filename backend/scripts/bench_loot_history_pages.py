@@ -0,0 +1,87 @@
+import sys
+from datetime import date, timedelta
+from timeit import timeit
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+
+from loot import cache
+from loot.models import Player, Item, Raid, RaidDay, LootHistory
+
+# Times getLootHistory pages with keyset pagination against the unpaginated list and an OFFSET page.
+# Runs against a throwaway in-memory database.
+# python manage.py runscript bench_loot_history_pages --script-args 500 50000 500000
+
+ROWS_PER_RAID_DAY = 25
+PAGE_SIZE = 100
+
+
+def seed(row_count):
+    raid = Raid.objects.create(id=1, name='Gruul', short_name='Gruul')
+    items = Item.objects.bulk_create([
+        Item(id=n, name=f'Item {n}', type='Trinket', category=Item.Categories.CASTER, raid=raid) for n in range(1, 101)
+    ])
+    players = Player.objects.bulk_create([Player(id=n, name=f'Player{n}', name_key=f'player{n}') for n in range(1, 41)])
+    raid_day_count = row_count // ROWS_PER_RAID_DAY + 1
+    RaidDay.objects.bulk_create([
+        RaidDay(id=n, name=f'Gruul {n}', date=date(2021, 1, 1) + timedelta(days=n // 2), raid=raid)
+        for n in range(1, raid_day_count + 1)
+    ])
+    raid_day_dates = dict(RaidDay.objects.values_list('id', 'date'))
+    LootHistory.objects.bulk_create((
+        LootHistory(raid_day_id=n // ROWS_PER_RAID_DAY + 1, raid_day_date=raid_day_dates[n // ROWS_PER_RAID_DAY + 1],
+                    item_id=items[n % 100].id, player_id=players[n % 40].id)
+        for n in range(row_count)
+    ), batch_size=5000)
+
+
+def time_get(client, path, number=5):
+    def get():
+        cache.clear()
+        assert client.get(path).status_code == 200
+
+    return timeit(get, number=number) / number * 1000
+
+
+def run(*args):
+    sizes = [int(arg) for arg in args] or [500, 50000]
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        client = APIClient()
+        # The last two columns time only the deep page's query, without the view around it
+        print(f"{'rows':>8} {'full list':>12} {'keyset first':>13} {'keyset deep':>12}"
+              f" {'keyset query':>13} {'offset query':>13}")
+        for size in sizes:
+            LootHistory.objects.all().delete()
+            RaidDay.objects.all().delete()
+            Item.objects.all().delete()
+            Player.objects.all().delete()
+            Raid.objects.all().delete()
+            seed(size)
+
+            # 90% of the way through the history
+            depth = size * 9 // 10
+            deep = LootHistory.objects.order_by('-raid_day_date', '-id')[depth]
+            cursor = f'{deep.raid_day_date.isoformat()}.{deep.id}'
+
+            def keyset_page():
+                return list(LootHistory.objects.order_by('-raid_day_date', '-id')
+                            .filter(raid_day_date__lte=deep.raid_day_date)
+                            .exclude(raid_day_date=deep.raid_day_date, id__gte=deep.id)[:PAGE_SIZE])
+
+            def offset_page():
+                return list(LootHistory.objects.order_by('-raid_day_date', '-id')[depth:depth + PAGE_SIZE])
+
+            full = time_get(client, '/api/getLootHistory/', number=1 if size > 100000 else 5)
+            first = time_get(client, f'/api/getLootHistory/?page_size={PAGE_SIZE}')
+            keyset = time_get(client, f'/api/getLootHistory/?page_size={PAGE_SIZE}&cursor={cursor}')
+            keyset_ms = timeit(keyset_page, number=5) / 5 * 1000
+            offset_ms = timeit(offset_page, number=5) / 5 * 1000
+            print(f'{size:>8} {full:>10.1f}ms {first:>11.1f}ms {keyset:>10.1f}ms'
+                  f' {keyset_ms:>11.1f}ms {offset_ms:>11.1f}ms')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        sys.stdout.flush()
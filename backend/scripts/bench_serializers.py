@@ -0,0 +1,58 @@
+import sys
+from timeit import timeit
+
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import setup_test_environment
+
+from loot import cache
+from loot.models import Player, RaidDay, LootHistory
+from loot.serializers import (PlayerSerializer, PlayerValuesSerializer, RaidDaySerializer, RaidDayValuesSerializer,
+                              LootHistorySerializer, LootHistoryValuesSerializer)
+from scripts.bench_api import GUILD_DEFAULTS, build_guild
+
+# Times serializing and rendering the players, raid days and loot history lists with the ModelSerializers
+# against the values_list() serializers, and checks that both give the same bytes.
+# Runs against a throwaway in-memory database.
+# python manage.py runscript bench_serializers --script-args [loot rows] [repeat]
+
+
+def time_render(serializer_class, queryset, context, number):
+    def render():
+        return cache.json_renderer.render(serializer_class(queryset.all(), many=True, context=context).data)
+
+    return timeit(render, number=number) / number * 1000, render()
+
+
+def run(*args):
+    loot_rows = int(args[0]) if args else GUILD_DEFAULTS['loot_rows']
+    number = int(args[1]) if len(args) > 1 else 5
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        build_guild(**dict(GUILD_DEFAULTS, loot_rows=loot_rows))
+        raid_day_ids = list(RaidDay.objects.order_by('id').values_list('id', flat=True))
+        # The prefetches PlayerViewSet used with PlayerSerializer
+        players = Player.objects.order_by('name').prefetch_related(
+            'wishlist',
+            Prefetch('alts', queryset=Player.objects.only('id')),
+            Prefetch('attendance', queryset=RaidDay.objects.only('id')),
+        )
+        cases = [
+            ('players', PlayerSerializer, PlayerValuesSerializer, players, {}),
+            ('players ranges', PlayerSerializer, PlayerValuesSerializer, players, {'raid_day_ids': raid_day_ids}),
+            ('raid days', RaidDaySerializer, RaidDayValuesSerializer, RaidDay.objects.all(), {}),
+            ('loot history', LootHistorySerializer, LootHistoryValuesSerializer,
+             LootHistory.objects.order_by('-raid_day_date', '-id'), {}),
+        ]
+
+        print(f"{'list':<16} {'rows':>7} {'model ms':>9} {'values ms':>10} {'speedup':>8} {'same bytes':>11}")
+        for name, serializer_class, values_serializer_class, queryset, context in cases:
+            model_ms, expected = time_render(serializer_class, queryset, context, number)
+            values_ms, actual = time_render(values_serializer_class, queryset, context, number)
+            print(f'{name:<16} {queryset.count():>7} {model_ms:>9.1f} {values_ms:>10.1f} '
+                  f'{model_ms / values_ms:>7.1f}x {str(actual == expected):>11}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        sys.stdout.flush()
@@ -0,0 +1,128 @@
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+
+from loot import cache
+from scripts.bench_loot_history_pages import seed
+
+# Compares read and write throughput with SQLite's defaults against settings.SQLITE_PRAGMAS and CONN_MAX_AGE.
+# Reader processes fetch getPlayers and a getLootHistory page while one writer uploads loot, like an officer
+# uploading mid-raid while the guild browses.  Runs against a throwaway database file.
+# python manage.py runscript bench_sqlite_tuning --script-args [readers] [seconds]
+
+SQLITE_DEFAULTS = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'mmap_size': 0, 'cache_size': -2000,
+                   'busy_timeout': 5000}
+READ_PATHS = ['/api/getPlayers/', '/api/getLootHistory/?page_size=100']
+UPLOAD_ROWS = 25
+
+
+def request(client, method, path, data=None):
+    # Opens and closes connections around each request the way the WSGI handler does, so CONN_MAX_AGE applies
+    close_old_connections()
+    try:
+        response = getattr(client, method)(path, data, format='json')
+        return response.status_code < 400
+    except Exception:
+        # Typically "database is locked" once busy_timeout runs out
+        return False
+    finally:
+        close_old_connections()
+
+
+def reader(deadline, results):
+    client = APIClient()
+    timings = []
+    failed = 0
+    while time.monotonic() < deadline:
+        for path in READ_PATHS:
+            # Measure the database, not the per-process response cache
+            cache.clear()
+            start = time.monotonic()
+            if request(client, 'get', path):
+                timings.append(time.monotonic() - start)
+            else:
+                failed += 1
+    results.put(('read', timings, failed))
+
+
+def writer(deadline, results):
+    client = APIClient()
+    client.force_authenticate(User.objects.get(username='bench'))
+    timings = []
+    failed = 0
+    while time.monotonic() < deadline:
+        rows = [{'player': f'Player{(len(timings) + n) % 40 + 1}-Faerlina', 'itemID': n % 100 + 1, 'class': 'MAGE',
+                 'response': 'Mainspec'} for n in range(UPLOAD_ROWS)]
+        start = time.monotonic()
+        if request(client, 'post', '/api/uploadLootHistory', {'raid_day_id': 1, 'data': json.dumps(rows)}):
+            timings.append(time.monotonic() - start)
+        else:
+            failed += 1
+    results.put(('write', timings, failed))
+
+
+def p95(timings):
+    return sorted(timings)[int(len(timings) * 0.95)] * 1000 if timings else 0
+
+
+def run_profile(pragmas, conn_max_age, reader_count, seconds):
+    settings.SQLITE_PRAGMAS = pragmas
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    # journal_mode sticks to the file, so switch it before anyone else connects
+    connections.close_all()
+    connection.ensure_connection()
+    connections.close_all()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    deadline = time.monotonic() + seconds
+    processes = [context.Process(target=reader, args=(deadline, results)) for _ in range(reader_count)]
+    processes.append(context.Process(target=writer, args=(deadline, results)))
+    for process in processes:
+        process.start()
+    totals = {'read': ([], [0]), 'write': ([], [0])}
+    for _ in processes:
+        kind, timings, failed = results.get()
+        totals[kind][0].extend(timings)
+        totals[kind][1][0] += failed
+    for process in processes:
+        process.join()
+    return totals
+
+
+def run(*args):
+    reader_count = int(args[0]) if args else 4
+    seconds = float(args[1]) if len(args) > 1 else 10
+    setup_test_environment()
+    tuned = dict(settings.SQLITE_PRAGMAS)
+    tuned_max_age = connection.settings_dict['CONN_MAX_AGE']
+
+    with tempfile.TemporaryDirectory() as directory:
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST']['NAME'] = str(Path(directory) / 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            seed(5000)
+            User.objects.create_user('bench', is_superuser=True, is_staff=True)
+
+            print(f'{reader_count} readers and 1 writer for {seconds:.0f}s each')
+            print(f"{'profile':>8} {'reads/s':>9} {'read p95':>10} {'writes/s':>9} {'write p95':>10} {'failed':>7}")
+            for name, pragmas, max_age in [('default', SQLITE_DEFAULTS, 0), ('tuned', tuned, tuned_max_age)]:
+                totals = run_profile(pragmas, max_age, reader_count, seconds)
+                (reads, [failed_reads]), (writes, [failed_writes]) = totals['read'], totals['write']
+                print(f'{name:>8} {len(reads) / seconds:>9.1f} {p95(reads):>8.1f}ms '
+                      f'{len(writes) / seconds:>9.1f} {p95(writes):>8.1f}ms {failed_reads + failed_writes:>7}')
+        finally:
+            settings.SQLITE_PRAGMAS = tuned
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            sys.stdout.flush()
@@ -0,0 +1,51 @@
+import csv
+
+from django.contrib.auth.models import User
+
+from loot.importer import Importer
+from loot.models import Item, ClassPrio, Raid, Boss
+
+# Adds a raid tier from a CSV with id, name, type, tier, bosses (; separated) and class_prio_1 ... columns,
+# in one transaction.  Items, bosses and prios that already exist are skipped, so it can be run again.
+# python manage.py runscript import_tier --script-args <raid id> <name> <short name> <csv> [prios set by username]
+
+
+def import_tier(raid_id, name, short_name, filename, user):
+    with open(filename) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+
+    with Importer() as importer:
+        importer.create(Raid, [Raid(id=raid_id, name=name, short_name=short_name)])
+
+        boss_ids = importer.ids(Boss, 'name', 'raid_id')
+        boss_names = {boss_name for row in rows for boss_name in row['bosses'].split(';')}
+        importer.create(Boss, [Boss(name=boss_name, raid_id=raid_id, order=1)
+                               for boss_name in sorted(boss_names) if (boss_name, raid_id) not in boss_ids])
+
+        importer.create(Item, [
+            Item(id=row['id'], name=row['name'], type=row['type'], tier=int(row['tier']), category='', notes='',
+                 raid_id=raid_id)
+            for row in rows
+        ])
+
+        boss_ids = importer.ids(Boss, 'name', 'raid_id')
+        ItemBoss = Item.bosses.through
+        importer.create(ItemBoss, [
+            ItemBoss(item_id=row['id'], boss_id=boss_ids[boss_name, raid_id])
+            for row in rows for boss_name in row['bosses'].split(';')
+        ])
+
+        prio_columns = [column for column in rows[0] if column.startswith('class_prio_')] if rows else []
+        importer.create(ClassPrio, [
+            ClassPrio(item_id=row['id'], class_name=row[column], prio=int(column.rsplit('_', 1)[1]), set_by=user)
+            for row in rows for column in prio_columns if row[column]
+        ])
+    print(importer.report())
+
+
+def run(raid_id, name, short_name, filename, username=None):
+    if username:
+        user = User.objects.get(username=username)
+    else:
+        user = User.objects.filter(is_superuser=True).first()
+    import_tier(int(raid_id), name, short_name, filename, user)
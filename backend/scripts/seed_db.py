@@ -1,175 +1,199 @@
 import csv
 from datetime import datetime
-from contextlib import suppress
 
+from django.conf import settings
 from django.core import management
 from django.contrib.auth.models import User
 
-from loot.models import Player, Wishlist, Item, ClassPrio, IndividualPrio, Raid, Boss, RaidDay, LootHistory
+from loot.importer import Importer
+from loot.models import (Player, Wishlist, Item, ClassPrio, IndividualPrio, Raid, Boss, RaidDay, LootHistory,
+                         normalize_name)
 
+# Builds a dev database from the CSVs in seed_data/, everything but the superuser in one transaction.
+# Rows that already exist are skipped, so it can be run again after a failure.
 
-def populate_from_csv(cls, filename):
+
+def read_csv(filename):
     with open(filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            cls.objects.create(**row).save()
+        return list(csv.DictReader(csvfile))
 
 
-def populate_raid_days(filename):
-    with open(filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            RaidDay.objects.create(
-                id=row['id'],
-                name=row['name'],
-                raid_id=row['raid_id'],
-                date=datetime.strptime(row['date'], '%m-%d-%Y').date(),
-            ).save()
-
-
-def populate_players(playerfilename, attendancefilename):
-    with open(playerfilename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            Player.objects.create(
-                id=row['id'],
-                name=row['name'],
-                notes=row['notes'],
-                player_class=Player.Classes[row['class'].upper().replace(" ", "_")],
-                role=Player.Roles[row['role'].upper().replace(" ", "_")],
-                rank=Player.Ranks[row['rank'].upper().replace(" ", "_")],
-            ).save()
+def choice(choices, value):
+    return choices[value.upper().replace(" ", "_")]
 
-    player_columns = [f'player_{x}' for x in range(1, 46)]
-    with open(attendancefilename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            raid_day = RaidDay.objects.get(id=row['id'])
-            for column in player_columns:
-                player_name = row[column]
-                with suppress(Player.DoesNotExist):
-                    player = Player.objects.get(name=player_name)
-                    player.attendance.add(raid_day)
-
-
-def populate_items(itemfilename, bosslootfilename):
-    default_raid = Raid.objects.all()[0]
-    with open(itemfilename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            try:
-                category = Item.Categories[row['category'].upper().replace(" ", "_")]
-            except KeyError:
-                category = ''
-
-            try:
-                tier = int(row['tier'])
-            except ValueError:
-                tier = None
-
-            Item.objects.create(
-                id=row['id'],
-                name=row['name'],
-                type=row['type'],
-                tier=tier,
-                category=category,
-                notes=row['notes'],
-                raid=default_raid,
-            ).save()
-
-    with open(bosslootfilename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            item = Item.objects.get(id=row['item_id'])
-            boss = Boss.objects.get(id=row['boss_id'])
-            item.raid = boss.raid
-            item.save()
-            item.bosses.add(boss)
-
-
-def populate_wishlist(filename):
-    wishlist_columns = [f'wishlist_{x}' for x in range(1, 15)]
-    with open(filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            player = Player.objects.get(name=row['name'])
-            for index, column in enumerate(wishlist_columns):
-                item_name = row.get(column)
-                if item_name:
-                    item = Item.objects.get(name=item_name)
-                    Wishlist.objects.create(player=player, item=item, priority=(index + 1)).save()
 
+def populate_from_csv(importer, cls, filename):
+    importer.create(cls, [cls(**row) for row in read_csv(filename)])
 
-def populate_loot_history(filename):
-    with open(filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            LootHistory.objects.create(
-                raid_day=RaidDay.objects.get(name=row['raid_day_name']),
-                item=Item.objects.get(name=row['item']),
-                player=Player.objects.get(name=row['player']),
-            ).save()
 
+def populate_raid_days(importer, filename):
+    importer.create(RaidDay, [
+        RaidDay(id=row['id'], name=row['name'], raid_id=row['raid_id'],
+                date=datetime.strptime(row['date'], '%m-%d-%Y').date())
+        for row in read_csv(filename)
+    ])
 
-def populate_prios(filename, user):
-    with open(filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            item = Item.objects.get(name=row['name'])
-            for n in (1, 2, 3, 4, 5):
-                column = f'individual_prio_{n}'
-                if row.get(column):
-                    IndividualPrio.objects.create(
-                        item=item,
-                        player=Player.objects.get(name=row[column]),
-                        prio=n,
-                        set_by=user,
-                    ).save()
-            for n in (1, 2, 3, 4):
-                column = f'class_prio_{n}'
-                if row.get(column):
-                    ClassPrio.objects.create(
-                        item=item,
-                        class_name=row[column],
-                        prio=n,
-                        set_by=user,
-                    ).save()
+
+def populate_players(importer, playerfilename, attendancefilename):
+    player_rows = read_csv(playerfilename)
+    name_keys = {normalize_name(row['name']) for row in player_rows}
+    raid_days = {row['id']: (datetime.strptime(row['date'], '%m-%d-%Y').date(), int(row['id']))
+                 for row in read_csv(attendancefilename)}
+
+    # name_key -> raid day ids, from the player_1 ... player_45 columns.  Unknown names are skipped.
+    attended = {}
+    player_columns = [f'player_{x}' for x in range(1, 46)]
+    for row in read_csv(attendancefilename):
+        for column in player_columns:
+            name_key = normalize_name(row[column] or '')
+            if name_key in name_keys:
+                attended.setdefault(name_key, []).append(row['id'])
+
+    # Players are active if their newest raid day is one of the newest INACTIVE_AFTER_RAID_DAYS
+    newest = sorted(raid_days.values(), reverse=True)[:settings.INACTIVE_AFTER_RAID_DAYS]
+    active_days = {raid_day_id for _, raid_day_id in newest}
+
+    players = []
+    for row in player_rows:
+        name_key = normalize_name(row['name'])
+        last_attended = max((raid_days[raid_day_id] for raid_day_id in attended.get(name_key, [])), default=None)
+        players.append(Player(
+            id=row['id'],
+            name=row['name'],
+            name_key=name_key,
+            notes=row['notes'],
+            player_class=choice(Player.Classes, row['class']),
+            role=choice(Player.Roles, row['role']),
+            rank=choice(Player.Ranks, row['rank']),
+            last_attended_id=last_attended and last_attended[1],
+            is_active=bool(last_attended) and last_attended[1] in active_days,
+        ))
+    importer.create(Player, players)
+
+    player_ids = importer.ids(Player, 'name_key')
+    Attendance = Player.attendance.through
+    importer.create(Attendance, [
+        Attendance(player_id=player_ids[name_key], raidday_id=raid_day_id)
+        for name_key, raid_day_ids in attended.items() for raid_day_id in raid_day_ids
+    ])
+
+
+def populate_items(importer, itemfilename, bosslootfilename):
+    default_raid_id = Raid.objects.values_list('id', flat=True)[0]
+    boss_raids = dict(Boss.objects.values_list('id', 'raid_id'))
+    boss_loot = read_csv(bosslootfilename)
+    # Items take the raid of the (last) boss that drops them
+    item_raids = {int(row['item_id']): boss_raids[int(row['boss_id'])] for row in boss_loot}
+
+    items = []
+    for row in read_csv(itemfilename):
+        try:
+            category = choice(Item.Categories, row['category'])
+        except KeyError:
+            category = ''
+
+        try:
+            tier = int(row['tier'])
+        except ValueError:
+            tier = None
+
+        items.append(Item(
+            id=row['id'],
+            name=row['name'],
+            type=row['type'],
+            tier=tier,
+            category=category,
+            notes=row['notes'],
+            raid_id=item_raids.get(int(row['id']), default_raid_id),
+        ))
+    importer.create(Item, items)
+
+    ItemBoss = Item.bosses.through
+    importer.create(ItemBoss, [ItemBoss(item_id=row['item_id'], boss_id=row['boss_id']) for row in boss_loot])
+
+
+def populate_wishlist(importer, filename):
+    player_ids = importer.ids(Player, 'name_key')
+    item_ids = importer.ids(Item, 'name')
+    wishlist_columns = [f'wishlist_{x}' for x in range(1, 15)]
+    importer.create(Wishlist, [
+        Wishlist(player_id=player_ids[normalize_name(row['name'])], item_id=item_ids[row[column]],
+                 priority=index + 1)
+        for row in read_csv(filename)
+        for index, column in enumerate(wishlist_columns) if row.get(column)
+    ])
+
+
+def populate_loot_history(importer, filename):
+    raid_days = dict(RaidDay.objects.values_list('id', 'date'))
+    raid_day_ids = importer.ids(RaidDay, 'name')
+    item_ids = importer.ids(Item, 'name')
+    player_ids = importer.ids(Player, 'name_key')
+    # Loot history has no natural key, so skip the rows a previous run already loaded
+    existing = set(LootHistory.objects.values_list('raid_day_id', 'item_id', 'player_id'))
+
+    loot_history = []
+    for row in read_csv(filename):
+        key = (raid_day_ids[row['raid_day_name']], item_ids[row['item']], player_ids[normalize_name(row['player'])])
+        if key not in existing:
+            existing.add(key)
+            loot_history.append(LootHistory(raid_day_id=key[0], raid_day_date=raid_days[key[0]], item_id=key[1],
+                                            player_id=key[2]))
+    importer.create(LootHistory, loot_history)
+
+
+def populate_prios(importer, filename, user):
+    player_ids = importer.ids(Player, 'name_key')
+    item_ids = importer.ids(Item, 'name')
+    individual_prios = []
+    class_prios = []
+    for row in read_csv(filename):
+        item_id = item_ids[row['name']]
+        for n in (1, 2, 3, 4, 5):
+            column = f'individual_prio_{n}'
+            if row.get(column):
+                individual_prios.append(IndividualPrio(
+                    item_id=item_id, player_id=player_ids[normalize_name(row[column])], prio=n, set_by=user))
+        for n in (1, 2, 3, 4):
+            column = f'class_prio_{n}'
+            if row.get(column):
+                class_prios.append(ClassPrio(item_id=item_id, class_name=row[column], prio=n, set_by=user))
+    importer.create(IndividualPrio, individual_prios)
+    importer.create(ClassPrio, class_prios)
 
 
 def run():
-    print('Populating Raids')
-    populate_from_csv(Raid, 'seed_data/raid.csv')
+    if not User.objects.exists():
+        print('Create Your Superuser (you can ignore email)')
+        management.call_command('createsuperuser')
+    user = User.objects.first()
 
-    print('Populating Bosses')
-    populate_from_csv(Boss, 'seed_data/bosses.csv')
+    with Importer() as importer:
+        print('Populating Raids')
+        populate_from_csv(importer, Raid, 'seed_data/raid.csv')
 
-    print('Populating Raid Days')
-    populate_raid_days('seed_data/attendance.csv')
+        print('Populating Bosses')
+        populate_from_csv(importer, Boss, 'seed_data/bosses.csv')
 
-    print('Populating Players')
-    populate_players('seed_data/players.csv', 'seed_data/attendance.csv')
+        print('Populating Raid Days')
+        populate_raid_days(importer, 'seed_data/attendance.csv')
 
-    print('Populating Items')
-    populate_items('seed_data/items.csv', 'seed_data/bossloot.csv')
+        print('Populating Players')
+        populate_players(importer, 'seed_data/players.csv', 'seed_data/attendance.csv')
 
-    print('Populating Wishlists')
-    populate_wishlist('seed_data/players.csv')
+        print('Populating Items')
+        populate_items(importer, 'seed_data/items.csv', 'seed_data/bossloot.csv')
 
-    # print('Populating Loot History')
-    # populate_loot_history('seed_data/loot_history.csv')
+        print('Populating Wishlists')
+        populate_wishlist(importer, 'seed_data/players.csv')
 
-    print('Create Your Superuser (you can ignore email)')
-    management.call_command('createsuperuser')
+        # print('Populating Loot History')
+        # populate_loot_history(importer, 'seed_data/loot_history.csv')
 
-    user = User.objects.first()
-    needs_player = True
-    while needs_player:
+        print('Populating Prios')
+        populate_prios(importer, 'seed_data/items.csv', user)
+    print(importer.report())
+
+    while not Player.objects.filter(user=user).exists():
         player_name = input('Player to attach user to: ')
-        with suppress(Player.DoesNotExist):
-            player = Player.objects.get(name__iexact=player_name)
-            player.user = user
-            player.save()
-            needs_player = False
-
-    print('Populating Prios')
-    populate_prios('seed_data/items.csv', user)
+        Player.objects.filter(name_key=normalize_name(player_name)).update(user=user)
@@ -52,10 +52,26 @@ class App extends React.Component {
     }
 
     for (const key of data) {
-      data_mapping[key]();
+      if (typeof key === 'string') {
+        data_mapping[key]();
+      } else {
+        this.patchRemoteData(key.name, key.delta);
+      }
     }
   }
 
+  // Applies a {revision, rows, deleted} response from a write endpoint without refetching the list
+  patchRemoteData(name, delta) {
+    this.setState(state => {
+      const changed = new Map(delta.rows.map(row => [row.id, row]));
+      const rows = state[name]
+        .filter(row => !delta.deleted.includes(row.id))
+        .map(row => changed.get(row.id) || row);
+      const existing = new Set(rows.map(row => row.id));
+      return {[name]: delta.rows.filter(row => !existing.has(row.id)).concat(rows)};
+    });
+  }
+
   getItems() {
     fetch('/api/getItems/').then(res => res.json()).then(data => {
       this.setState({items: data})
@@ -92,13 +108,22 @@ class App extends React.Component {
     });
   }
 
+  // Everything the app needs on startup in one request
+  getBootstrap() {
+    fetch('/api/bootstrap').then(res => res.json()).then(data => {
+      this.setState({
+        loggedInPlayer: data.current_user.player,
+        items: data.items,
+        players: data.players,
+        lootHistory: data.loot_history,
+        raids: data.raids,
+        raidDays: data.raid_days,
+      })
+    });
+  }
+
   componentDidMount() {
-    this.getItems();
-    this.getPlayers();
-    this.getLootHistory();
-    this.getRaids();
-    this.getRaidDays();
-    this.getCurrentUser();
+    this.getBootstrap();
   }
 
   handleTabValueChange(e, v) {
@@ -17,34 +17,39 @@ export function postApi(path, data) {
   })
 }
 
+// Write endpoints return the rows they changed, so patch local state with them and only refetch on errors
+function patchOrRefetch(name, updateRemoteData) {
+  return res => {
+    if (res.json) {
+      return res.json.then(delta => updateRemoteData({'name': name, 'delta': delta}));
+    } else {
+      updateRemoteData(name);
+    }
+  };
+}
+
 function updatePlayer(player, updateRemoteData) {
-  return postApi('/api/updatePlayer', {'player': player}).then(_res => {
-    updateRemoteData('players');
-  });
+  return postApi('/api/updatePlayer', {'player': player}).then(patchOrRefetch('players', updateRemoteData));
 }
 
 function updateItem(item, updateRemoteData) {
-  return postApi('/api/updateItem', {'item': item}).then(_res => {
-    updateRemoteData('items');
-  });
+  return postApi('/api/updateItem', {'item': item}).then(patchOrRefetch('items', updateRemoteData));
 }
 
 function updateLootHistory(lh, updateRemoteData) {
-  return postApi('/api/updateLootHistory', {'row': lh}).then(_res => {
-    updateRemoteData('lootHistory');
-  });
+  return postApi('/api/updateLootHistory', {'row': lh}).then(patchOrRefetch('lootHistory', updateRemoteData));
 }
 
 function addLootHistory(lh, updateRemoteData) {
-  return postApi('/api/addLootHistory', {'row': lh}).then(_res => {
-    updateRemoteData('lootHistory');
-  });
+  return postApi('/api/addLootHistory', {'row': lh}).then(patchOrRefetch('lootHistory', updateRemoteData));
 }
 
 function deleteLootHistory(lh, updateRemoteData) {
-  return postApi('/api/deleteLootHistory', {'id': lh.id}).then(_res => {
-    updateRemoteData('lootHistory');
-  });
+  return postApi('/api/deleteLootHistory', {'id': lh.id}).then(patchOrRefetch('lootHistory', updateRemoteData));
+}
+
+function batchLootHistory(operations, updateRemoteData) {
+  return postApi('/api/batchLootHistory', {'operations': operations}).then(patchOrRefetch('lootHistory', updateRemoteData));
 }
 
 function updateUser(user, updateRemoteData) {
@@ -68,6 +73,7 @@ const Api = {
     add: addLootHistory,
     update: updateLootHistory,
     delete: deleteLootHistory,
+    batch: batchLootHistory,
   },
   user: {
     update: updateUser,